@@ -6,21 +6,34 @@ WITH ENHANCED DEVICE FINGERPRINTING - STRICT ONE DEVICE POLICY
 """
 
 import os
+import asyncio
+import atexit
 import time
 import threading
 import json
 import uuid
 import hashlib
+import hmac
 import subprocess
-from collections import defaultdict, namedtuple
+import heapq
+import queue
+import itertools
+from abc import ABC, abstractmethod
+from collections import defaultdict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from dotenv import load_dotenv
 import telebot
 from telebot import types
 import random
 from datetime import datetime
-from flask import Flask
+from flask import Flask, request, abort
 import platform
 import socket
+import socketserver
+import signal
+import sys
+import sqlite3
 
 app = Flask(__name__)
 
@@ -28,7 +41,36 @@ load_dotenv()
 
 # === BOT TOKEN ===
 TOKEN = (os.getenv("BOT_TOKEN") or "").strip()
-bot = telebot.TeleBot(TOKEN)
+
+class RateLimitedTeleBot(telebot.TeleBot):
+    """TeleBot whose outbound chat calls pass through outbound_limiter (see OUTBOUND RATE LIMITING)"""
+    def send_message(self, chat_id, *args, cosmetic=False, critical=False, **kwargs):
+        """cosmetic=True: shed (return None) rather than wait for a rate-limit token.
+        critical=True: wait as long as it takes (quiz runner only)."""
+        return outbound_limiter.call(chat_id, super().send_message, chat_id, *args,
+                                     cosmetic=cosmetic, critical=critical, **kwargs)
+
+    def edit_message_text(self, *args, cosmetic=False, critical=False, **kwargs):
+        chat_id = kwargs.get("chat_id", args[1] if len(args) > 1 else None)
+        return outbound_limiter.call(chat_id, super().edit_message_text, *args,
+                                     cosmetic=cosmetic, critical=critical, **kwargs)
+
+    def delete_message(self, chat_id, *args, **kwargs):
+        # Deletions don't count against per-chat send limits, only the global budget
+        return outbound_limiter.call(None, super().delete_message, chat_id, *args, **kwargs)
+
+    def delete_messages(self, chat_id, message_ids):
+        """deleteMessages (not wrapped by this pyTelegramBotAPI version)"""
+        return outbound_limiter.call(
+            None, telebot.apihelper._make_request, self.token, 'deleteMessages',
+            params={'chat_id': chat_id, 'message_ids': json.dumps(list(message_ids))}, method='post'
+        )
+
+    def answer_callback_query(self, *args, **kwargs):
+        # Callback answers are never throttled, but still honor 429 retry_after
+        return outbound_limiter.call(None, super().answer_callback_query, *args, throttle=False, **kwargs)
+
+bot = RateLimitedTeleBot(TOKEN)
 
 # Validate token early so we fail fast with a clear message instead of noisy 401 loops
 def validate_bot_token_or_exit():
@@ -44,7 +86,8 @@ def validate_bot_token_or_exit():
         # Exit to avoid infinite retry loop and repeated 401 logs
         raise SystemExit(1)
 
-validate_bot_token_or_exit()
+if "--state-server" not in sys.argv:  # The state server doesn't talk to Telegram
+    validate_bot_token_or_exit()
 
 # === CONFIGURATION ===
 CONFIG = {
@@ -53,12 +96,15 @@ CONFIG = {
     "POINTS_FIRST_CORRECT_BONUS": 5,
     "QUESTIONS_FILE": "questions.json",
     "PARTICIPANTS_FILE": "participants.json",
-    "QUIZ_COMPLETION_FILE": "quiz_completed.json",
+    "QUIZ_COMPLETION_FILE": "quiz_completed.json",  # Legacy format, imported into the log on first start
+    "QUIZ_COMPLETION_LOG": "quiz_completed.log",
     "DEVICE_FINGERPRINT_FILE": "device_fingerprints.json",
     "ADMIN_IDS": [int(id.strip()) for id in os.getenv("ADMIN_IDS", "").split(",") if id.strip()],  # Replace with your user ID
     "QUESTION_TRANSITION_DELAY": 2,
     "AUTO_DELETE_DELAY": 100,  # 1 minutes for most messages
     "START_MESSAGE_DELAY": 60,  # ⚡ CHANGED: 1 minute for start message (was 480)
+    "AUTO_DELETE_WORKERS": 4,  # Threads issuing delete_message calls for due auto-deletes
+    "AUTO_DELETE_PERSIST_INTERVAL": 1.0,  # Seconds between batched writes of the pending-deletion queue
     "ALLOW_DEVICE_CHANGE": False  # Strict one device policy - NO CHANGES ALLOWED
 }
 
@@ -68,7 +114,559 @@ CONFIG.setdefault("SHUFFLE_OPTIONS", True)
 # Optional seed for reproducible shuffles (None for random)
 CONFIG.setdefault("SHUFFLE_SEED", None)
 
+# Outbound rate limits (Telegram allows ~30 msg/s overall, ~1 msg/s per private chat, 20 msg/min per group)
+CONFIG.setdefault("RATE_LIMIT_GLOBAL_PER_SEC", 30)
+CONFIG.setdefault("RATE_LIMIT_PRIVATE_PER_SEC", 1)
+CONFIG.setdefault("RATE_LIMIT_GROUP_PER_MIN", 20)
+CONFIG.setdefault("RATE_LIMIT_CRITICAL_RESERVE", 5)  # Per-chat tokens cosmetic calls (countdowns, feedback, scoreboard) leave for quiz messages
+CONFIG.setdefault("RATE_LIMIT_MAX_RETRIES", 3)  # Retries after a 429 response
+CONFIG.setdefault("RATE_LIMIT_MAX_WAIT", 5.0)  # Seconds a command reply may wait for a token before it is dropped
+
+# Outbound send queue used by the answer handler
+CONFIG.setdefault("OUTBOUND_WORKERS", 4)
+CONFIG.setdefault("OUTBOUND_QUEUE_MAX_PER_CHAT", 50)  # Oldest queued message is dropped beyond this
+CONFIG.setdefault("OUTBOUND_COALESCE_INTERVAL", 3.0)  # Seconds between feedback messages to one chat; messages queued meanwhile are joined
+
+# Live Points: "edit" keeps one message per chat updated in place, "messages" sends a new one per answer
+CONFIG.setdefault("LIVE_SCOREBOARD_MODE", "edit")
+CONFIG.setdefault("LIVE_SCOREBOARD_INTERVAL", 2.0)  # Minimum seconds between edits of a chat's scoreboard
+CONFIG.setdefault("LIVE_SCOREBOARD_TOP", 10)  # Participants listed in Live Points
+
+# Seconds remaining at which the countdown message is edited (add 0 for a "Time's up!" edit)
+CONFIG.setdefault("COUNTDOWN_MARKS", [10, 5, 3, 2, 1])
+
+# Update ingestion: "polling" (default) or "webhook" (Telegram POSTs updates to the Flask app)
+CONFIG.setdefault("UPDATE_MODE", os.getenv("UPDATE_MODE", "polling"))
+CONFIG.setdefault("WEBHOOK_URL", os.getenv("WEBHOOK_URL", ""))  # Public base URL, e.g. https://your-app.onrender.com
+CONFIG.setdefault("WEBHOOK_SECRET", os.getenv("WEBHOOK_SECRET", ""))  # Path and header secret (derived from the token if empty)
+CONFIG.setdefault("WEBHOOK_WORKERS", 8)  # Threads running handlers for webhook updates
+CONFIG.setdefault("WEBHOOK_MAX_PENDING", 1000)  # Updates accepted but not yet handled before returning 503
+
+# Execution engine: "threads" (default) or "asyncio" (AsyncTeleBot event loop; needs aiohttp)
+CONFIG.setdefault("ENGINE", os.getenv("ENGINE", "threads"))
+CONFIG.setdefault("ASYNC_HANDLER_WORKERS", 16)  # Threads running the synchronous handlers under the asyncio engine
+CONFIG.setdefault("ASYNC_POLL_TIMEOUT", 30)  # Long-poll timeout for getUpdates under the asyncio engine
+
+# State that several bot instances must agree on: "memory" (this process only) or "network" (shared state server)
+CONFIG.setdefault("STATE_BACKEND", os.getenv("STATE_BACKEND", "memory"))
+CONFIG.setdefault("STATE_SERVER_ADDRESS", os.getenv("STATE_SERVER_ADDRESS", "127.0.0.1:7420"))
+CONFIG.setdefault("STATE_SERVER_SECRET", os.getenv("STATE_SERVER_SECRET", ""))  # Shared secret for state server connections (derived from the token if empty)
+CONFIG.setdefault("NODE_ID", os.getenv("NODE_ID") or f"{socket.gethostname()}:{os.getpid()}")
+CONFIG.setdefault("STATE_INBOX_POLL", 0.1)  # Seconds between checks for answers forwarded by other instances
+
+# Questions whose send/answer timings are kept in memory for analysis
+CONFIG.setdefault("TIMING_HISTORY", 500)
+
+# Checkpoints of running quizzes, used to resume (or finalize) them after a restart
+CONFIG.setdefault("CHECKPOINT_INTERVAL", 1.0)  # Seconds between incremental checkpoint writes
+CONFIG.setdefault("CHECKPOINT_RECOVERY", "resume")  # "resume" or "finalize" interrupted quizzes on startup
+CONFIG.setdefault("CHECKPOINT_MAX_AGE", 3600)  # Older checkpoints are finalized instead of resumed
+
+# Worker processes for sharded mode (chats are split by chat_id); 0 or 1 runs everything in one process
+CONFIG.setdefault("SHARD_WORKERS", int(os.getenv("SHARD_WORKERS", "0")))
+
+# Quizzes allowed to run at once; further /start_quiz requests wait in a queue
+CONFIG.setdefault("MAX_CONCURRENT_QUIZZES", 50)
+
+# SQLite database holding participant records (JSON files are imported on first start)
+CONFIG.setdefault("DATABASE_FILE", "quiz_data.sqlite3")
+# Seconds between write-behind flushes of the participant cache
+CONFIG.setdefault("PARTICIPANT_FLUSH_INTERVAL", 2.0)
+# Persist a user's device last_used at most once per this many seconds
+CONFIG.setdefault("DEVICE_LAST_USED_PERSIST_INTERVAL", 600)
+# Seconds between batched writes of queued last_used updates
+CONFIG.setdefault("DEVICE_FLUSH_INTERVAL", 30)
+# Versions of changed-row history kept so shared caches can refresh single rows
+CONFIG.setdefault("DATA_CHANGE_LOG_VERSIONS", 1000)
+
+# === SQLITE STORAGE ENGINE ===
+db_lock = threading.RLock()
+_db_conn = None
+
+def get_db():
+    """Get the shared SQLite connection, creating schema and migrating JSON data on first use"""
+    global _db_conn
+    if _db_conn is None:
+        with db_lock:
+            if _db_conn is None:
+                conn = sqlite3.connect(CONFIG["DATABASE_FILE"], timeout=30, check_same_thread=False)
+                conn.row_factory = sqlite3.Row
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                init_database(conn)
+                migrate_json_to_sqlite(conn)
+                _db_conn = conn
+    return _db_conn
+
+@contextmanager
+def db_transaction():
+    """Serialize access to the shared connection and commit (or roll back) as one transaction"""
+    conn = get_db()
+    with db_lock:
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+def init_database(conn):
+    """Create tables and indexes if they don't exist"""
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS storage_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS participants (
+            user_id TEXT PRIMARY KEY,
+            name TEXT,
+            first_seen TEXT,
+            last_seen TEXT,
+            chat_ids TEXT NOT NULL DEFAULT '[]',
+            total_score INTEGER NOT NULL DEFAULT 0,
+            quizzes_completed INTEGER NOT NULL DEFAULT 0,
+            accuracy REAL NOT NULL DEFAULT 0,
+            has_completed_current_quiz INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS device_fingerprints (
+            user_id TEXT PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            device_id TEXT,
+            registered_at TEXT,
+            last_used TEXT
+        );
+        -- Reverse index: fingerprint -> user_ids, used for device-sharing checks
+        CREATE INDEX IF NOT EXISTS idx_device_fingerprints_fingerprint
+            ON device_fingerprints (fingerprint);
+        CREATE TABLE IF NOT EXISTS pending_deletions (
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            due_at REAL NOT NULL,
+            PRIMARY KEY (chat_id, message_id)
+        );
+        CREATE TABLE IF NOT EXISTS device_ids (
+            user_id TEXT PRIMARY KEY,
+            device_id TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS quiz_checkpoints (
+            chat_id INTEGER PRIMARY KEY,
+            run_id TEXT NOT NULL,
+            started_by INTEGER,
+            questions TEXT NOT NULL,
+            current_q INTEGER NOT NULL,
+            quiz_start_time_ns INTEGER,
+            updated_at REAL NOT NULL,
+            question_message_id INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS quiz_checkpoint_participants (
+            chat_id INTEGER NOT NULL,
+            run_id TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            name TEXT,
+            score INTEGER NOT NULL,
+            total_time_ns INTEGER NOT NULL,
+            correct_answers INTEGER NOT NULL,
+            answers TEXT NOT NULL,
+            PRIMARY KEY (chat_id, user_id)
+        );
+        -- Rows changed by each data version bump; row_key '*' means the whole table
+        CREATE TABLE IF NOT EXISTS data_changes (
+            name TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            row_key TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_data_changes_version
+            ON data_changes (name, version);
+    """)
+    # Databases created before checkpoints recorded the live question message
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(quiz_checkpoints)")}
+    if "question_message_id" not in columns:
+        conn.execute("ALTER TABLE quiz_checkpoints ADD COLUMN question_message_id INTEGER")
+    conn.commit()
+
+def import_legacy_json(conn, meta_key, path, importer):
+    """Run importer(conn, data) on a legacy JSON file once, recording completion in storage_meta"""
+    done = conn.execute("SELECT value FROM storage_meta WHERE key = ?", (meta_key,)).fetchone()
+    if done:
+        return
+
+    imported = 0
+    try:
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+            importer(conn, legacy)
+            imported = len(legacy)
+    except Exception as e:
+        print(f"Warning: could not import {path}, starting empty: {e}")
+
+    conn.execute(
+        "INSERT OR REPLACE INTO storage_meta (key, value) VALUES (?, ?)",
+        (meta_key, datetime.now().strftime("%Y-%m-%dT%H:%M:%S"))
+    )
+    conn.commit()
+    if imported:
+        print(f"✅ Imported {imported} records from {path} into SQLite")
+
+def migrate_json_to_sqlite(conn):
+    """One-time import of the legacy JSON data files into the database"""
+    import_legacy_json(
+        conn, "participants_json_imported", CONFIG["PARTICIPANTS_FILE"],
+        lambda c, data: c.executemany(PARTICIPANT_UPSERT_SQL,
+                                      [participant_to_row(uid, p) for uid, p in data.items()])
+    )
+    import_legacy_json(
+        conn, "device_fingerprints_json_imported", CONFIG["DEVICE_FINGERPRINT_FILE"],
+        lambda c, data: c.executemany(DEVICE_UPSERT_SQL,
+                                      [device_to_row(uid, d) for uid, d in data.items() if d.get("fingerprint")])
+    )
+    migrate_device_id_files(conn)
+
+def migrate_device_id_files(conn):
+    """One-time import of the per-user device_id_{user_id}.txt files into the device_ids table"""
+    done = conn.execute("SELECT value FROM storage_meta WHERE key = 'device_id_files_imported'").fetchone()
+    if done:
+        return
+
+    rows = []
+    files = []
+    for file in os.listdir('.'):
+        if file.startswith('device_id_') and file.endswith('.txt'):
+            try:
+                with open(file, 'r') as f:
+                    device_id = f.read().strip()
+                if device_id:
+                    rows.append((file[len('device_id_'):-len('.txt')], device_id))
+                files.append(file)
+            except Exception as e:
+                print(f"Warning: could not read {file}: {e}")
+
+    conn.executemany("INSERT OR IGNORE INTO device_ids (user_id, device_id) VALUES (?, ?)", rows)
+    conn.execute(
+        "INSERT OR REPLACE INTO storage_meta (key, value) VALUES ('device_id_files_imported', ?)",
+        (datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),)
+    )
+    conn.commit()
+
+    # Only remove the files once their contents are committed
+    for file in files:
+        try:
+            os.remove(file)
+        except Exception as e:
+            print(f"Warning: could not remove {file}: {e}")
+    if rows:
+        print(f"✅ Imported {len(rows)} device ID files into SQLite")
+
+def close_db():
+    """Close the shared connection (before forking worker processes)"""
+    global _db_conn
+    with db_lock:
+        if _db_conn is not None:
+            _db_conn.close()
+            _db_conn = None
+
+def bump_data_version(conn, name, row_keys=None):
+    """Increment and return the change counter other processes use to detect stale caches.
+
+    `row_keys` lists the rows this change touched (None: the whole table).
+    """
+    conn.execute(
+        "INSERT INTO storage_meta (key, value) VALUES (?, '1') "
+        "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1",
+        (f"version:{name}",)
+    )
+    version = read_data_version(name, conn)
+    keys = {"*"} if row_keys is None else {str(key) for key in row_keys}
+    conn.executemany("INSERT INTO data_changes (name, version, row_key) VALUES (?, ?, ?)",
+                     [(name, version, key) for key in keys])
+    conn.execute("DELETE FROM data_changes WHERE name = ? AND version <= ?",
+                 (name, version - CONFIG["DATA_CHANGE_LOG_VERSIONS"]))
+    return version
+
+def read_data_changes(conn, name, since, version):
+    """Row keys changed after `since` up to `version`, or None if the whole table must be reloaded"""
+    if since is None or since < version - CONFIG["DATA_CHANGE_LOG_VERSIONS"] or since > version:
+        return None
+    rows = conn.execute("SELECT DISTINCT row_key FROM data_changes WHERE name = ? AND version > ? AND version <= ?",
+                        (name, since, version)).fetchall()
+    keys = {row["row_key"] for row in rows}
+    return None if "*" in keys else keys
+
+def fetch_rows(conn, table, keys):
+    """SELECT * rows of `table` whose user_id is in `keys` (chunked under SQLite's variable limit)"""
+    keys = list(keys)
+    rows = []
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i + 500]
+        rows.extend(conn.execute(
+            f"SELECT * FROM {table} WHERE user_id IN ({', '.join('?' for _ in chunk)})", chunk
+        ).fetchall())
+    return rows
+
+def read_data_version(name, conn=None):
+    if conn is None:
+        with db_transaction() as conn:
+            return read_data_version(name, conn)
+    row = conn.execute("SELECT value FROM storage_meta WHERE key = ?", (f"version:{name}",)).fetchone()
+    return int(row["value"]) if row else 0
+
+PARTICIPANT_COLUMNS = ("name", "first_seen", "last_seen", "chat_ids", "total_score",
+                       "quizzes_completed", "accuracy", "has_completed_current_quiz")
+
+PARTICIPANT_UPSERT_SQL = (
+    "INSERT OR REPLACE INTO participants (user_id, " + ", ".join(PARTICIPANT_COLUMNS) + ") "
+    "VALUES (?, " + ", ".join("?" for _ in PARTICIPANT_COLUMNS) + ")"
+)
+
+def participant_to_row(user_id, data):
+    """Convert a participant dict into a parameter tuple for PARTICIPANT_UPSERT_SQL"""
+    return (
+        str(user_id),
+        data.get("name"),
+        data.get("first_seen"),
+        data.get("last_seen"),
+        json.dumps(data.get("chat_ids", [])),
+        data.get("total_score", 0),
+        data.get("quizzes_completed", 0),
+        data.get("accuracy", 0),
+        1 if data.get("has_completed_current_quiz", False) else 0,
+    )
+
+def participant_from_row(row):
+    """Convert a participants table row back into the legacy participant dict"""
+    data = {
+        "name": row["name"],
+        "first_seen": row["first_seen"],
+        "last_seen": row["last_seen"],
+        "chat_ids": json.loads(row["chat_ids"] or "[]"),
+        "total_score": row["total_score"],
+        "quizzes_completed": row["quizzes_completed"],
+        "accuracy": row["accuracy"],
+        "has_completed_current_quiz": bool(row["has_completed_current_quiz"]),
+    }
+    # Optional fields are omitted (not None) so `"first_seen" in data` checks keep working
+    return {k: v for k, v in data.items() if v is not None}
+
+# === OUTBOUND RATE LIMITING ===
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def try_take(self, reserve=0):
+        """Take a token if more than `reserve` are left; otherwise return how long to wait before trying again"""
+        with self.lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1 + reserve:
+                self.tokens -= 1
+                return 0.0
+            return (1 + reserve - self.tokens) / self.rate
+
+    def give_back(self):
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + 1)
+
+    def is_idle(self):
+        """True once the bucket has refilled completely and isn't blocked by a 429"""
+        with self.lock:
+            now = time.monotonic()
+            return now >= self.blocked_until and self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+    def block_for(self, seconds):
+        """Stop handing out tokens for `seconds` (Telegram's retry_after)"""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            # Resume with a single token once the block ends, then refill at the normal rate
+            self.tokens = 1
+            self.updated = self.blocked_until
+
+class OutboundDropped(Exception):
+    """A call waited RATE_LIMIT_MAX_WAIT for a rate-limit token and was dropped"""
+
+class OutboundRateLimiter:
+    """Per-chat and global token buckets in front of every outbound Bot API call, with 429 backoff.
+
+    Critical calls (the quiz runner's intro, questions and final results) wait
+    as long as it takes for a token. Ordinary calls (command replies, admin
+    messages) wait at most RATE_LIMIT_MAX_WAIT and then raise OutboundDropped,
+    so a throttled group can't hold the handler threads. Cosmetic calls never
+    wait: they need a token beyond RATE_LIMIT_CRITICAL_RESERVE in the chat's
+    bucket, and are shed (the call returns None) when there is none or
+    Telegram answers 429.
+    """
+    def __init__(self):
+        self.global_bucket = TokenBucket(CONFIG["RATE_LIMIT_GLOBAL_PER_SEC"], CONFIG["RATE_LIMIT_GLOBAL_PER_SEC"])
+        self.chat_buckets = {}
+        self.lock = threading.Lock()
+        self.stats = {"calls": 0, "throttled": 0, "retried": 0, "dropped": 0, "shed": 0}
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            with self.lock:
+                bucket = self.chat_buckets.get(chat_id)
+                if bucket is None:
+                    if chat_id < 0:  # Groups and channels
+                        per_min = CONFIG["RATE_LIMIT_GROUP_PER_MIN"]
+                        bucket = TokenBucket(per_min / 60, per_min)
+                    else:
+                        per_sec = CONFIG["RATE_LIMIT_PRIVATE_PER_SEC"]
+                        bucket = TokenBucket(per_sec, per_sec)
+                    self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def prune_idle(self):
+        """Drop chat buckets that are full again; a new one starts full, so nothing changes for the chat"""
+        with self.lock:
+            idle = [chat_id for chat_id, bucket in self.chat_buckets.items() if bucket.is_idle()]
+            for chat_id in idle:
+                del self.chat_buckets[chat_id]
+        return len(idle)
+
+    def _next_wait(self, buckets, taken, deadline):
+        """Take tokens in order; return the next wait, 0 once all are taken, None if it would pass deadline"""
+        while len(taken) < len(buckets):
+            wait = buckets[len(taken)].try_take()
+            if wait > 0:
+                if deadline is not None and time.monotonic() + wait > deadline:
+                    for bucket in taken:
+                        bucket.give_back()
+                    return None
+                return wait
+            taken.append(buckets[len(taken)])
+        return 0
+
+    def _acquire(self, buckets, deadline=None):
+        """Wait for a token from every bucket; False (nothing taken) if that would pass deadline"""
+        taken, throttled = [], False
+        while True:
+            wait = self._next_wait(buckets, taken, deadline)
+            if not wait:
+                return wait is not None
+            if not throttled:
+                throttled = True
+                self._count("throttled")
+            time.sleep(wait)
+
+    async def _acquire_async(self, buckets, deadline=None):
+        taken, throttled = [], False
+        while True:
+            wait = self._next_wait(buckets, taken, deadline)
+            if not wait:
+                return wait is not None
+            if not throttled:
+                throttled = True
+                self._count("throttled")
+            await asyncio.sleep(wait)
+
+    def _deadline(self, critical):
+        return None if critical else time.monotonic() + CONFIG["RATE_LIMIT_MAX_WAIT"]
+
+    def try_acquire(self, buckets):
+        """Take tokens for a cosmetic call without waiting; False (nothing taken) if any bucket is short"""
+        taken = []
+        for bucket in buckets:
+            reserve = 0 if bucket is self.global_bucket else CONFIG["RATE_LIMIT_CRITICAL_RESERVE"]
+            if bucket.try_take(reserve) > 0:
+                for taken_bucket in taken:
+                    taken_bucket.give_back()
+                return False
+            taken.append(bucket)
+        return True
+
+    def buckets_for(self, chat_id):
+        buckets = [self.global_bucket]
+        if isinstance(chat_id, int):
+            buckets.insert(0, self._chat_bucket(chat_id))
+        return buckets
+
+    def _retry_after(self, e, attempt, buckets, cosmetic):
+        """Return retry_after for a retryable 429, None for a shed cosmetic call, otherwise re-raise e"""
+        if e.error_code != 429:
+            raise e
+        retry_after = (e.result_json.get("parameters") or {}).get("retry_after", 1)
+        # A 429 blocks the whole chat (or the bot, for chat-less calls) until retry_after passes
+        buckets[0].block_for(retry_after)
+        if cosmetic:
+            self._count("shed")
+            return None
+        if attempt == CONFIG["RATE_LIMIT_MAX_RETRIES"]:
+            self._count("dropped")
+            raise e
+        self._count("retried")
+        return retry_after
+
+    def call(self, chat_id, func, /, *args, throttle=True, cosmetic=False, critical=False, **kwargs):
+        """Run func once tokens are available; retry on 429 after the server's retry_after"""
+        self._count("calls")
+        buckets = self.buckets_for(chat_id)
+        deadline = self._deadline(critical)
+        for attempt in range(CONFIG["RATE_LIMIT_MAX_RETRIES"] + 1):
+            if cosmetic:
+                if not self.try_acquire(buckets):
+                    self._count("shed")
+                    return None
+            elif throttle and not self._acquire(buckets, deadline):
+                self._count("dropped")
+                raise OutboundDropped(f"no rate-limit token for chat {chat_id} within {CONFIG['RATE_LIMIT_MAX_WAIT']}s")
+            try:
+                return func(*args, **kwargs)
+            except telebot.apihelper.ApiTelegramException as e:
+                retry_after = self._retry_after(e, attempt, buckets, cosmetic)
+                if retry_after is None:
+                    return None
+                if not throttle:
+                    time.sleep(retry_after)
+
+    async def call_async(self, chat_id, func, /, *args, throttle=True, cosmetic=False, critical=False, **kwargs):
+        """call() for AsyncTeleBot coroutine methods; waits with asyncio.sleep instead of blocking"""
+        from telebot import asyncio_helper
+        self._count("calls")
+        buckets = self.buckets_for(chat_id)
+        deadline = self._deadline(critical)
+        for attempt in range(CONFIG["RATE_LIMIT_MAX_RETRIES"] + 1):
+            if cosmetic:
+                if not self.try_acquire(buckets):
+                    self._count("shed")
+                    return None
+            elif throttle and not await self._acquire_async(buckets, deadline):
+                self._count("dropped")
+                raise OutboundDropped(f"no rate-limit token for chat {chat_id} within {CONFIG['RATE_LIMIT_MAX_WAIT']}s")
+            try:
+                return await func(*args, **kwargs)
+            except asyncio_helper.ApiTelegramException as e:
+                retry_after = self._retry_after(e, attempt, buckets, cosmetic)
+                if retry_after is None:
+                    return None
+                if not throttle:
+                    await asyncio.sleep(retry_after)
+
+outbound_limiter = OutboundRateLimiter()
+
 # === ENHANCED DEVICE FINGERPRINTING ===
+# In-process cache of the device_ids table
+device_id_cache = {}
+
+def clear_device_ids():
+    """Forget every stored device ID (users get new ones on next use)"""
+    with db_transaction() as conn:
+        conn.execute("DELETE FROM device_ids")
+        bump_data_version(conn, "devices")
+    device_id_cache.clear()
+    fingerprint_cache.clear()
+
 def get_device_id(user_id=None):
     """Get a persistent device identifier specific to each user"""
     try:
@@ -76,20 +674,24 @@ def get_device_id(user_id=None):
             # This should rarely happen, but provide a fallback
             return f"fallback_{uuid.uuid4()}"
             
-        # User-specific device ID file
-        device_id_file = f"device_id_{user_id}.txt"
-        
-        if os.path.exists(device_id_file):
-            with open(device_id_file, 'r') as f:
-                existing_id = f.read().strip()
-                if existing_id:
-                    return existing_id
-        
-        # Generate new device ID
-        new_id = str(uuid.uuid4())
-        with open(device_id_file, 'w') as f:
-            f.write(new_id)
-        return new_id
+        user_id_str = str(user_id)
+        existing_id = device_id_cache.get(user_id_str)
+        if existing_id:
+            return existing_id
+        
+        with db_transaction() as conn:
+            row = conn.execute("SELECT device_id FROM device_ids WHERE user_id = ?", (user_id_str,)).fetchone()
+            if row:
+                existing_id = row["device_id"]
+            else:
+                # Generate new device ID (another worker process may have just stored one)
+                conn.execute("INSERT OR IGNORE INTO device_ids (user_id, device_id) VALUES (?, ?)",
+                             (user_id_str, str(uuid.uuid4())))
+                existing_id = conn.execute("SELECT device_id FROM device_ids WHERE user_id = ?",
+                                           (user_id_str,)).fetchone()["device_id"]
+        
+        device_id_cache[user_id_str] = existing_id
+        return existing_id
     except Exception as e:
         print(f"Error getting device ID: {e}")
         return f"fallback_{uuid.uuid4()}"
@@ -114,80 +716,324 @@ def generate_device_fingerprint(user_id=None):
             return hashlib.sha256(f"fallback_{user_id}".encode()).hexdigest()
         return hashlib.sha256(f"fallback_{uuid.uuid4()}".encode()).hexdigest()
     
+DEVICE_UPSERT_SQL = (
+    "INSERT OR REPLACE INTO device_fingerprints (user_id, fingerprint, device_id, registered_at, last_used) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+
+def device_to_row(user_id, data):
+    """Convert a device record into a parameter tuple for DEVICE_UPSERT_SQL"""
+    return (str(user_id), data.get("fingerprint"), data.get("device_id"),
+            data.get("registered_at"), data.get("last_used"))
+
+def device_from_row(row):
+    """Convert a device_fingerprints row back into the legacy record dict"""
+    data = {
+        "fingerprint": row["fingerprint"],
+        "device_id": row["device_id"],
+        "registered_at": row["registered_at"],
+        "last_used": row["last_used"],
+    }
+    return {k: v for k, v in data.items() if v is not None}
+
+class DeviceRegistry:
+    """In-memory view of the device_fingerprints table.
+
+    Registrations and resets are written through to SQLite immediately.
+    `last_used` is only tracked in memory and persisted in batches, at most
+    once per user every DEVICE_LAST_USED_PERSIST_INTERVAL seconds. With
+    `shared` set (sharded mode) rows another process changed are re-read
+    from SQLite using the data_changes log.
+    """
+    def __init__(self, persist_interval, flush_interval):
+        self.persist_interval = persist_interval
+        self.flush_interval = flush_interval
+        self.lock = threading.RLock()
+        self.records = None
+        self.by_fingerprint = None
+        self.last_persisted = {}
+        self.dirty = set()
+        self.flusher_thread = None
+        self.stop_event = threading.Event()
+        self.shared = False
+        self.version = None
+
+    def _ensure_loaded(self):
+        if self.records is not None and self.shared:
+            self._refresh()
+        if self.records is None:
+            with db_transaction() as conn:
+                self.version = read_data_version("devices", conn)
+                rows = conn.execute("SELECT * FROM device_fingerprints").fetchall()
+            self.records = {row["user_id"]: device_from_row(row) for row in rows}
+            self.by_fingerprint = defaultdict(set)
+            for uid, data in self.records.items():
+                self.by_fingerprint[data.get("fingerprint")].add(uid)
+
+    def _refresh(self):
+        """Re-read only the rows other processes changed since our version"""
+        with db_transaction() as conn:
+            version = read_data_version("devices", conn)
+            if version == self.version:
+                return
+            changed = read_data_changes(conn, "devices", self.version, version)
+            rows = fetch_rows(conn, "device_fingerprints", changed) if changed else []
+        self.flush()
+        if changed is None:
+            self.records = None
+            device_id_cache.clear()
+            fingerprint_cache.clear()
+            return
+        fresh = {row["user_id"]: device_from_row(row) for row in rows}
+        for uid in changed:
+            self._unindex(uid)
+            data = fresh.get(uid)
+            if data is None:
+                self.records.pop(uid, None)
+            else:
+                self.records[uid] = data
+                self.by_fingerprint[data.get("fingerprint")].add(uid)
+            self.dirty.discard(uid)
+            device_id_cache.pop(uid, None)
+            fingerprint_cache.pop(uid, None)
+            if uid.isdigit():
+                fingerprint_cache.pop(int(uid), None)
+        self.version = version
+
+    def _bump(self, conn, user_id_str):
+        # Stay current only if no other process wrote since our last load
+        version = bump_data_version(conn, "devices", [user_id_str])
+        if version == self.version + 1:
+            self.version = version
+
+    def _unindex(self, user_id_str):
+        old = self.records.get(user_id_str)
+        if old is not None:
+            users = self.by_fingerprint.get(old.get("fingerprint"))
+            if users is not None:
+                users.discard(user_id_str)
+                if not users:
+                    del self.by_fingerprint[old.get("fingerprint")]
+
+    def get(self, user_id):
+        with self.lock:
+            self._ensure_loaded()
+            data = self.records.get(str(user_id))
+            return dict(data) if data is not None else None
+
+    def all(self):
+        with self.lock:
+            self._ensure_loaded()
+            return {uid: dict(data) for uid, data in self.records.items()}
+
+    def users_for_fingerprint(self, fingerprint):
+        with self.lock:
+            self._ensure_loaded()
+            return list(self.by_fingerprint.get(fingerprint, ()))
+
+    def shared_fingerprint_count(self):
+        with self.lock:
+            self._ensure_loaded()
+            return sum(1 for users in self.by_fingerprint.values() if len(users) > 1)
+
+    def put(self, user_id, data):
+        """Store a record and write it through to SQLite"""
+        user_id_str = str(user_id)
+        with self.lock:
+            self._ensure_loaded()
+            with db_transaction() as conn:
+                conn.execute(DEVICE_UPSERT_SQL, device_to_row(user_id_str, data))
+                self._bump(conn, user_id_str)
+            self._unindex(user_id_str)
+            self.records[user_id_str] = dict(data)
+            self.by_fingerprint[data.get("fingerprint")].add(user_id_str)
+            self.last_persisted[user_id_str] = time.monotonic()
+            self.dirty.discard(user_id_str)
+
+    def delete(self, user_id):
+        user_id_str = str(user_id)
+        with self.lock:
+            self._ensure_loaded()
+            with db_transaction() as conn:
+                cur = conn.execute("DELETE FROM device_fingerprints WHERE user_id = ?", (user_id_str,))
+                self._bump(conn, user_id_str)
+            self._unindex(user_id_str)
+            self.records.pop(user_id_str, None)
+            self.dirty.discard(user_id_str)
+            return cur.rowcount > 0
+
+    def replace_all(self, fingerprints):
+        with self.lock:
+            with db_transaction() as conn:
+                conn.execute("DELETE FROM device_fingerprints")
+                conn.executemany(DEVICE_UPSERT_SQL, [device_to_row(uid, data) for uid, data in fingerprints.items()])
+                bump_data_version(conn, "devices")
+            self.records = None
+            self.last_persisted = {}
+            self.dirty = set()
+            self._ensure_loaded()
+
+    def touch(self, user_id):
+        """Bump last_used in memory; queue it for persistence if the user's last write is old enough"""
+        user_id_str = str(user_id)
+        with self.lock:
+            self._ensure_loaded()
+            data = self.records.get(user_id_str)
+            if data is None:
+                return
+            data["last_used"] = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+            if time.monotonic() - self.last_persisted.get(user_id_str, float("-inf")) >= self.persist_interval:
+                self.dirty.add(user_id_str)
+
+    def flush(self):
+        """Persist queued last_used updates in a single transaction"""
+        with self.lock:
+            if not self.dirty:
+                return 0
+            updates = [(self.records[uid].get("last_used"), uid) for uid in self.dirty if uid in self.records]
+            self.dirty = set()
+            now = time.monotonic()
+            for _, uid in updates:
+                self.last_persisted[uid] = now
+        try:
+            with db_transaction() as conn:
+                conn.executemany("UPDATE device_fingerprints SET last_used = ? WHERE user_id = ?", updates)
+            return len(updates)
+        except Exception as e:
+            print(f"Error flushing device last_used: {e}")
+            with self.lock:
+                self.dirty.update(uid for _, uid in updates)
+            return 0
+
+    def start_flusher(self):
+        if self.flusher_thread and self.flusher_thread.is_alive():
+            return
+
+        def _flush_loop():
+            while not self.stop_event.wait(self.flush_interval):
+                self.flush()
+
+        self.stop_event.clear()
+        self.flusher_thread = threading.Thread(target=_flush_loop, daemon=True)
+        self.flusher_thread.start()
+
+    def shutdown(self):
+        self.stop_event.set()
+        self.flush()
+
+device_registry = DeviceRegistry(CONFIG["DEVICE_LAST_USED_PERSIST_INTERVAL"], CONFIG["DEVICE_FLUSH_INTERVAL"])
+atexit.register(device_registry.shutdown)
+
+# Current fingerprint per user; avoids re-reading the device ID and re-hashing on every answer
+fingerprint_cache = {}
+
+def get_current_fingerprint(user_id):
+    """Cached generate_device_fingerprint for the verification fast path"""
+    fingerprint = fingerprint_cache.get(user_id)
+    if fingerprint is None:
+        fingerprint = generate_device_fingerprint(user_id)
+        fingerprint_cache[user_id] = fingerprint
+    return fingerprint
+
 def load_device_fingerprints():
-    """Load device fingerprints from file"""
+    """Load all device fingerprints as {user_id_str: data}"""
     try:
-        if not os.path.exists(CONFIG["DEVICE_FINGERPRINT_FILE"]):
-            return {}
-        
-        with open(CONFIG["DEVICE_FINGERPRINT_FILE"], 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return device_registry.all()
     except Exception as e:
         print(f"Error loading device fingerprints: {e}")
         return {}
     
 def save_device_fingerprints(fingerprints):
-    """Save device fingerprints to file"""
+    """Replace all device fingerprints"""
     try:
-        with open(CONFIG["DEVICE_FINGERPRINT_FILE"], 'w', encoding='utf-8') as f:
-            json.dump(fingerprints, f, indent=2, ensure_ascii=False)
+        device_registry.replace_all(fingerprints)
+        fingerprint_cache.clear()
         return True
     except Exception as e:
         print(f"Error saving device fingerprints: {e}")
         return False
 
+def save_device_record(user_id, data):
+    """Insert or update one user's device record"""
+    try:
+        device_registry.put(user_id, data)
+        return True
+    except Exception as e:
+        print(f"Error saving device record for {user_id}: {e}")
+        return False
+
+def delete_device_record(user_id):
+    """Remove one user's device record; returns True if it existed"""
+    try:
+        return device_registry.delete(user_id)
+    except Exception as e:
+        print(f"Error deleting device record for {user_id}: {e}")
+        return False
+
+def get_fingerprint_users(fingerprint):
+    """Look up all user_ids registered with a fingerprint (reverse index)"""
+    try:
+        return device_registry.users_for_fingerprint(fingerprint)
+    except Exception as e:
+        print(f"Error looking up fingerprint users: {e}")
+        return []
+
+def count_shared_fingerprints():
+    """Count fingerprints registered to more than one user"""
+    try:
+        return device_registry.shared_fingerprint_count()
+    except Exception as e:
+        print(f"Error counting shared fingerprints: {e}")
+        return 0
+
 def verify_user_device_simple(user_id):
     """Simple device verification for answer handling"""
     return verify_user_device_strict(user_id)
 
 def register_user_device_strict(user_id):
     """Strict device registration - one device can only have ONE user"""
-    fingerprints = load_device_fingerprints()
     user_id_str = str(user_id)
     
-    current_fingerprint = generate_device_fingerprint(user_id)
+    current_fingerprint = get_current_fingerprint(user_id)
     
-    # Check if this device is already used by another user
-    for existing_user_id, data in fingerprints.items():
-        if data.get("fingerprint") == current_fingerprint and existing_user_id != user_id_str:
+    # Check if this device is already used by another user (reverse index lookup)
+    for existing_user_id in get_fingerprint_users(current_fingerprint):
+        if existing_user_id != user_id_str:
             return False, "device_already_used"
     
     # Check if this user already has a device registered
-    if user_id_str in fingerprints:
-        stored_fingerprint = fingerprints[user_id_str].get("fingerprint")
+    device_info = get_user_device_info(user_id)
+    if device_info is not None:
+        stored_fingerprint = device_info.get("fingerprint")
         if stored_fingerprint == current_fingerprint:
             # Same device - update timestamp
-            fingerprints[user_id_str]["last_used"] = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
-            save_device_fingerprints(fingerprints)
+            device_registry.touch(user_id)
             return True, "device_verified"
         else:
             # User trying to use different device - BLOCK!
             return False, "different_device"
     
     # Register new device for this user
-    fingerprints[user_id_str] = {
+    save_device_record(user_id, {
         "fingerprint": current_fingerprint,
         "registered_at": datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
         "last_used": datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
         "device_id": get_device_id(user_id)
-    }
-    save_device_fingerprints(fingerprints)
+    })
     return True, "device_registered"
 
 def verify_user_device_strict(user_id):
-    """Strict device verification"""
-    fingerprints = load_device_fingerprints()
-    user_id_str = str(user_id)
+    """Strict device verification (served from memory; last_used is persisted in batches)"""
+    device_info = device_registry.get(user_id)
     
-    if user_id_str not in fingerprints:
+    if device_info is None:
         return False
     
-    current_fingerprint = generate_device_fingerprint(user_id)
-    stored_fingerprint = fingerprints[user_id_str].get("fingerprint")
+    current_fingerprint = get_current_fingerprint(user_id)
+    stored_fingerprint = device_info.get("fingerprint")
     
     # Update last used
-    fingerprints[user_id_str]["last_used"] = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
-    save_device_fingerprints(fingerprints)
+    device_registry.touch(user_id)
     
     return current_fingerprint == stored_fingerprint
 
@@ -203,45 +1049,801 @@ def cleanup_shared_device_id():
 
 def get_user_device_info(user_id):
     """Get user's device registration info"""
-    fingerprints = load_device_fingerprints()
-    user_id_str = str(user_id)
-    
-    if user_id_str in fingerprints:
-        return fingerprints[user_id_str]
-    return None
+    try:
+        return device_registry.get(user_id)
+    except Exception as e:
+        print(f"Error loading device info for {user_id}: {e}")
+        return None
 
 # === MESSAGE AUTO-DELETION SYSTEM ===
+DELETE_BATCH_LIMIT = 100  # Telegram's maximum message_ids per deleteMessages call
+
+delete_stats = {"batch_calls": 0, "batch_failures": 0, "single_calls": 0, "api_calls_saved": 0}
+delete_stats_lock = threading.Lock()
+
+def delete_steps(chat_id, message_ids):
+    """Plan a bulk deletion: deleteMessages (up to 100 per call), falling back to single deletes.
+
+    Yields ("batch", chunk) or ("single", message_id); the caller makes the
+    call and sends back the exception it raised (or None). Shared by
+    delete_messages_bulk and AsyncEngine.delete_messages.
+    """
+    message_ids = list(dict.fromkeys(mid for mid in message_ids if mid))
+    for start in range(0, len(message_ids), DELETE_BATCH_LIMIT):
+        chunk = message_ids[start:start + DELETE_BATCH_LIMIT]
+        if len(chunk) > 1:
+            error = yield "batch", chunk
+            if error is None:
+                with delete_stats_lock:
+                    delete_stats["batch_calls"] += 1
+                    delete_stats["api_calls_saved"] += len(chunk) - 1
+                continue
+            print(f"Batch delete failed in chat {chat_id}, falling back to single deletes: {error}")
+            with delete_stats_lock:
+                delete_stats["batch_failures"] += 1
+        for message_id in chunk:
+            # A failure usually means the message was already deleted or is not accessible
+            yield "single", message_id
+            with delete_stats_lock:
+                delete_stats["single_calls"] += 1
+
+def delete_messages_bulk(chat_id, message_ids):
+    """Delete messages in one chat with as few API calls as possible"""
+    steps = delete_steps(chat_id, message_ids)
+    error = None
+    while True:
+        try:
+            kind, target = steps.send(error)
+        except StopIteration:
+            return
+        try:
+            if kind == "batch":
+                bot.delete_messages(chat_id, target)
+            else:
+                bot.delete_message(chat_id, target)
+            error = None
+        except Exception as e:
+            error = e
+
+class AutoDeleteScheduler:
+    """One scheduler thread owns every pending deletion in a min-heap keyed by due time.
+
+    Due deletions are handed to a bounded worker pool, so the number of
+    threads no longer grows with the number of messages sent. The queue is
+    mirrored to the pending_deletions table in small batches so deletions
+    survive a restart.
+    """
+    def __init__(self, max_workers, persist_interval):
+        self.heap = []
+        self.cond = threading.Condition()
+        self.sequence = itertools.count()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="auto-delete")
+        self.in_flight = 0
+        self.thread = None
+        self.persist_interval = persist_interval
+        self.unsaved_added = []
+        self.unsaved_done = []
+        # dispatch(chat_id, message_ids) starts the deletion and must call finish() when done
+        self.dispatch = self._submit
+
+    def _ensure_started(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def schedule(self, chat_id, message_id, delay):
+        due_at = time.time() + delay
+        with self.cond:
+            heapq.heappush(self.heap, (due_at, next(self.sequence), chat_id, message_id))
+            self.unsaved_added.append((chat_id, message_id, due_at))
+            self.cond.notify()
+            self._ensure_started()
+
+    def restore(self):
+        """Reload persisted deletions after a restart; overdue ones run in the first batch"""
+        try:
+            with db_transaction() as conn:
+                rows = conn.execute("SELECT chat_id, message_id, due_at FROM pending_deletions").fetchall()
+        except Exception as e:
+            print(f"Error loading pending deletions: {e}")
+            return 0
+        # In sharded mode every worker restores only its own chats
+        rows = [row for row in rows if owns_chat(row["chat_id"])]
+        with self.cond:
+            for row in rows:
+                heapq.heappush(self.heap, (row["due_at"], next(self.sequence), row["chat_id"], row["message_id"]))
+            self.cond.notify()
+            self._ensure_started()
+        return len(rows)
+
+    def pending_count(self):
+        """Deletions still waiting in the heap or currently being executed"""
+        with self.cond:
+            return len(self.heap) + self.in_flight
+
+    def persist(self):
+        """Write queued additions and completed deletions in one transaction"""
+        with self.cond:
+            added, done = self.unsaved_added, self.unsaved_done
+            self.unsaved_added, self.unsaved_done = [], []
+        if not added and not done:
+            return
+        try:
+            with db_transaction() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO pending_deletions (chat_id, message_id, due_at) VALUES (?, ?, ?)", added
+                )
+                conn.executemany("DELETE FROM pending_deletions WHERE chat_id = ? AND message_id = ?", done)
+        except Exception as e:
+            print(f"Error persisting pending deletions: {e}")
+            with self.cond:
+                self.unsaved_added[:0] = added
+                self.unsaved_done[:0] = done
+
+    def _run(self):
+        last_persist = time.monotonic()
+        while True:
+            with self.cond:
+                while not self.heap or self.heap[0][0] > time.time():
+                    timeout = self.heap[0][0] - time.time() if self.heap else None
+                    if self.unsaved_added or self.unsaved_done:
+                        persist_in = self.persist_interval - (time.monotonic() - last_persist)
+                        if persist_in <= 0:
+                            break
+                        timeout = persist_in if timeout is None else min(timeout, persist_in)
+                    self.cond.wait(timeout)
+                now = time.time()
+                due = []
+                while self.heap and self.heap[0][0] <= now:
+                    due.append(heapq.heappop(self.heap))
+                self.in_flight += len(due)
+            # Group by chat so each chat's due messages go out as one deleteMessages call
+            by_chat = defaultdict(list)
+            for _, _, chat_id, message_id in due:
+                by_chat[chat_id].append(message_id)
+            for chat_id, message_ids in by_chat.items():
+                self.dispatch(chat_id, message_ids)
+            if time.monotonic() - last_persist >= self.persist_interval:
+                self.persist()
+                last_persist = time.monotonic()
+
+    def _submit(self, chat_id, message_ids):
+        self.executor.submit(self._delete, chat_id, message_ids)
+
+    def _delete(self, chat_id, message_ids):
+        try:
+            delete_messages_bulk(chat_id, message_ids)
+        finally:
+            self.finish(chat_id, message_ids)
+
+    def finish(self, chat_id, message_ids):
+        """Record dispatched deletions as done"""
+        with self.cond:
+            self.in_flight -= len(message_ids)
+            self.unsaved_done.extend((chat_id, message_id) for message_id in message_ids)
+            self.cond.notify()
+
+auto_delete_scheduler = AutoDeleteScheduler(CONFIG["AUTO_DELETE_WORKERS"], CONFIG["AUTO_DELETE_PERSIST_INTERVAL"])
+atexit.register(auto_delete_scheduler.persist)
+
 def schedule_auto_delete(chat_id, message_id, delay=None):
     """Automatically delete message after given delay"""
     if delay is None:
         delay = CONFIG["AUTO_DELETE_DELAY"]
-    
-    def _delete_later():
-        time.sleep(delay)
-        try:
-            bot.delete_message(chat_id, message_id)
-        except Exception as e:
-            # Message might already be deleted or not accessible
-            pass
-    
-    threading.Thread(target=_delete_later, daemon=True).start()
+    auto_delete_scheduler.schedule(chat_id, message_id, delay)
+
+# === OUTBOUND SEND QUEUE ===
+MAX_MESSAGE_LENGTH = 4096  # Telegram's limit for one text message
+
+class OutboundQueue:
+    """Per-chat queues of outgoing feedback messages, coalesced and drained by a small worker pool.
+
+    Handlers enqueue and return immediately. A chat is handled by at most one
+    worker at a time and gets at most one message per OUTBOUND_COALESCE_INTERVAL:
+    everything queued meanwhile (with the same send options) is joined into it.
+    Workers never wait for rate-limit tokens; a chat without one is retried
+    after the interval while its messages keep coalescing. When a chat's queue
+    is full the oldest queued message is dropped.
+    """
+    def __init__(self, workers, max_per_chat, interval):
+        self.workers = workers
+        self.max_per_chat = max_per_chat
+        self.interval = interval
+        self.cond = threading.Condition()
+        self.queues = {}
+        self.active_chats = set()
+        self.schedule = []  # Heap of (due, seq, chat_id)
+        self.seq = itertools.count()
+        self.last_sent = {}
+        self.threads = []
+        self.stats = {"enqueued": 0, "sent": 0, "coalesced": 0, "deferred": 0, "failed": 0, "overflow_dropped": 0}
+
+    def _ensure_started(self):
+        if not self.threads:
+            for _ in range(self.workers):
+                thread = threading.Thread(target=self._worker, daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def _trim(self, chat_queue):
+        while len(chat_queue) > self.max_per_chat:
+            chat_queue.popleft()
+            self.stats["overflow_dropped"] += 1
+
+    def enqueue(self, chat_id, text, auto_delete=True, delay=None, key=None, **kwargs):
+        """Queue bot.send_message(chat_id, text, **kwargs); the sent message is auto-deleted unless auto_delete=False.
+
+        A message with a `key` replaces a still-queued message with the same key.
+        """
+        with self.cond:
+            self._ensure_started()
+            chat_queue = self.queues.setdefault(chat_id, deque())
+            if key is not None:
+                for i, item in enumerate(chat_queue):
+                    if item[4] == key:
+                        del chat_queue[i]
+                        break
+            chat_queue.append((text, kwargs, auto_delete, delay, key))
+            self._trim(chat_queue)
+            self.stats["enqueued"] += 1
+            if chat_id not in self.active_chats:
+                self.active_chats.add(chat_id)
+                due = max(time.monotonic(), self.last_sent.get(chat_id, 0) + self.interval)
+                heapq.heappush(self.schedule, (due, next(self.seq), chat_id))
+                self.cond.notify()
+
+    def pending_count(self):
+        with self.cond:
+            return sum(len(q) for q in self.queues.values())
+
+    def _take_batch(self, chat_queue):
+        """Pop the leading messages that share send options and fit in one Telegram message"""
+        batch = [chat_queue.popleft()]
+        length = len(batch[0][0])
+        while chat_queue:
+            text, kwargs, auto_delete, delay, _ = chat_queue[0]
+            if (kwargs, auto_delete, delay) != batch[0][1:4] or length + 2 + len(text) > MAX_MESSAGE_LENGTH:
+                break
+            batch.append(chat_queue.popleft())
+            length += 2 + len(text)
+        return batch
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                while not self.schedule or self.schedule[0][0] > time.monotonic():
+                    self.cond.wait(self.schedule[0][0] - time.monotonic() if self.schedule else None)
+                _, _, chat_id = heapq.heappop(self.schedule)
+                chat_queue = self.queues.get(chat_id)
+                batch = self._take_batch(chat_queue) if chat_queue else []
+            msg = None
+            if batch:
+                _, kwargs, auto_delete, delay, _ = batch[0]
+                try:
+                    # Feedback is cosmetic: it never waits for a token, so a throttled chat can't hold up the others
+                    msg = bot.send_message(chat_id, "\n\n".join(item[0] for item in batch), cosmetic=True, **kwargs)
+                    if msg is None:
+                        with self.cond:
+                            # No token yet: keep the messages (and keep coalescing) until the next attempt
+                            chat_queue.extendleft(reversed(batch))
+                            self._trim(chat_queue)
+                            self.stats["deferred"] += 1
+                    else:
+                        if auto_delete:
+                            schedule_auto_delete(chat_id, msg.message_id, delay)
+                        with self.cond:
+                            self.stats["sent"] += 1
+                            self.stats["coalesced"] += len(batch) - 1
+                except Exception as e:
+                    print(f"Error sending queued message to {chat_id}: {e}")
+                    with self.cond:
+                        self.stats["failed"] += 1
+            with self.cond:
+                now = time.monotonic()
+                if msg is not None:
+                    self.last_sent[chat_id] = now
+                if self.queues.get(chat_id):
+                    heapq.heappush(self.schedule, (now + self.interval, next(self.seq), chat_id))
+                    self.cond.notify()
+                else:
+                    self.queues.pop(chat_id, None)
+                    self.active_chats.discard(chat_id)
+                    if now - self.last_sent.get(chat_id, 0) >= self.interval:
+                        self.last_sent.pop(chat_id, None)
+
+outbound_queue = OutboundQueue(CONFIG["OUTBOUND_WORKERS"], CONFIG["OUTBOUND_QUEUE_MAX_PER_CHAT"],
+                               CONFIG["OUTBOUND_COALESCE_INTERVAL"])
 
 # === DATA STRUCTURES ===
 Question = namedtuple("Question", ["q", "opts", "correct_index"])
 
+# === SHARED STATE BACKEND ===
+class StateBackend(ABC):
+    """Key-value store for state that several bot instances must agree on.
+
+    Values are JSON-compatible. Each key has a version that compare_and_set
+    checks and bumps atomically. Sets and lists are separate keyspaces with
+    atomic add and drain operations.
+    """
+    shared = False  # True when other instances see the same data
+
+    @abstractmethod
+    def get(self, key):
+        """Return (value, version); (None, 0) for a key that was never set"""
+
+    @abstractmethod
+    def compare_and_set(self, key, expected_version, value):
+        """Store value only if the key is still at expected_version"""
+
+    @abstractmethod
+    def delete(self, key):
+        """Remove a key from every keyspace"""
+
+    @abstractmethod
+    def set_add_many(self, key, members):
+        """Add members; returns the ones that were not present"""
+
+    @abstractmethod
+    def set_remove(self, key, member):
+        ...
+
+    @abstractmethod
+    def set_contains(self, key, member):
+        ...
+
+    @abstractmethod
+    def set_members(self, key):
+        ...
+
+    @abstractmethod
+    def list_push(self, key, item):
+        ...
+
+    @abstractmethod
+    def list_drain(self, key):
+        """Remove and return every item in the list"""
+
+    def set_add(self, key, member):
+        """Add one member; False if it was already present"""
+        return bool(self.set_add_many(key, [member]))
+
+    def put(self, key, value):
+        """Unconditional write built on compare_and_set"""
+        while True:
+            _, version = self.get(key)
+            if self.compare_and_set(key, version, value):
+                return
+
+class InMemoryStateBackend(StateBackend):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+        self.sets = defaultdict(set)
+        self.lists = defaultdict(list)
+
+    def get(self, key):
+        with self.lock:
+            return self.values.get(key, (None, 0))
+
+    def compare_and_set(self, key, expected_version, value):
+        with self.lock:
+            _, version = self.values.get(key, (None, 0))
+            if version != expected_version:
+                return False
+            # Deleted values keep their version so an old expected_version can't match again
+            self.values[key] = (value, version + 1)
+            return True
+
+    def delete(self, key):
+        with self.lock:
+            if key in self.values:
+                self.values[key] = (None, self.values[key][1] + 1)
+            self.sets.pop(key, None)
+            self.lists.pop(key, None)
+
+    def set_add_many(self, key, members):
+        with self.lock:
+            current = self.sets[key]
+            added = [member for member in dict.fromkeys(members) if member not in current]
+            current.update(added)
+            return added
+
+    def set_remove(self, key, member):
+        with self.lock:
+            current = self.sets.get(key)
+            if current is None or member not in current:
+                return False
+            current.discard(member)
+            return True
+
+    def set_contains(self, key, member):
+        with self.lock:
+            return member in self.sets.get(key, ())
+
+    def set_members(self, key):
+        with self.lock:
+            return list(self.sets.get(key, ()))
+
+    def list_push(self, key, item):
+        with self.lock:
+            self.lists[key].append(item)
+
+    def list_drain(self, key):
+        with self.lock:
+            return self.lists.pop(key, [])
+
+STATE_SERVER_OPS = {"get", "compare_and_set", "delete", "set_add_many", "set_remove",
+                    "set_contains", "set_members", "list_push", "list_drain"}
+
+def state_server_secret():
+    return (CONFIG["STATE_SERVER_SECRET"] or hashlib.sha256(f"state-server:{TOKEN}".encode()).hexdigest()).encode()
+
+def state_server_proof(nonce):
+    """HMAC of the server's per-connection nonce under the shared secret"""
+    return hmac.new(state_server_secret(), nonce.encode(), hashlib.sha256).hexdigest()
+
+class NetworkStateBackend(StateBackend):
+    """Client for the state server (`python main.py --state-server`); one JSON line per request.
+
+    Each connection starts with a challenge: the server sends a nonce and
+    the client answers with its HMAC under STATE_SERVER_SECRET. Traffic is
+    not encrypted, so only run the state server on a trusted network.
+    """
+    shared = True
+
+    def __init__(self, address, timeout=5):
+        host, port = address.rsplit(":", 1)
+        self.address = (host, int(port))
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            sock = socket.create_connection(self.address, timeout=self.timeout)
+            stream = sock.makefile("rwb")
+            try:
+                nonce = json.loads(stream.readline())["nonce"]
+                stream.write(json.dumps({"auth": state_server_proof(nonce)}).encode() + b"\n")
+                stream.flush()
+                reply = json.loads(stream.readline() or b'{"error": "connection closed"}')
+            except (OSError, ValueError, KeyError):
+                sock.close()
+                raise ConnectionError("state server handshake failed")
+            if "error" in reply:
+                sock.close()
+                raise ConnectionError(f"state server: {reply['error']}")
+            conn = self.local.conn = (sock, stream)
+        return conn
+
+    def _close(self):
+        conn = getattr(self.local, "conn", None)
+        self.local.conn = None
+        if conn:
+            try:
+                conn[1].close()
+                conn[0].close()
+            except OSError:
+                pass
+
+    def _call(self, op, *args):
+        payload = json.dumps({"op": op, "args": args}).encode() + b"\n"
+        for attempt in range(2):
+            try:
+                stream = self._connection()[1]
+                stream.write(payload)
+                stream.flush()
+                line = stream.readline()
+            except OSError:
+                self._close()
+                raise
+            if not line:
+                # The server closed an idle connection before reading the request; safe to resend
+                self._close()
+                if attempt:
+                    raise ConnectionError("state server closed the connection")
+                continue
+            reply = json.loads(line)
+            if "error" in reply:
+                raise RuntimeError(f"state server: {reply['error']}")
+            return reply["result"]
+
+    def get(self, key):
+        value, version = self._call("get", key)
+        return value, version
+
+    def compare_and_set(self, key, expected_version, value):
+        return self._call("compare_and_set", key, expected_version, value)
+
+    def delete(self, key):
+        return self._call("delete", key)
+
+    def set_add_many(self, key, members):
+        return self._call("set_add_many", key, list(members))
+
+    def set_remove(self, key, member):
+        return self._call("set_remove", key, member)
+
+    def set_contains(self, key, member):
+        return self._call("set_contains", key, member)
+
+    def set_members(self, key):
+        return self._call("set_members", key)
+
+    def list_push(self, key, item):
+        return self._call("list_push", key, item)
+
+    def list_drain(self, key):
+        return self._call("list_drain", key)
+
+class StateRequestHandler(socketserver.StreamRequestHandler):
+    def _authenticate(self):
+        nonce = uuid.uuid4().hex
+        self.wfile.write(json.dumps({"nonce": nonce}).encode() + b"\n")
+        self.wfile.flush()
+        try:
+            proof = str(json.loads(self.rfile.readline())["auth"])
+        except (ValueError, KeyError, TypeError):
+            proof = ""
+        if not hmac.compare_digest(proof, state_server_proof(nonce)):
+            self.wfile.write(json.dumps({"error": "authentication failed"}).encode() + b"\n")
+            self.wfile.flush()
+            return False
+        self.wfile.write(json.dumps({"result": True}).encode() + b"\n")
+        self.wfile.flush()
+        return True
+
+    def handle(self):
+        if not self._authenticate():
+            return
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                if request["op"] not in STATE_SERVER_OPS:
+                    raise ValueError(f"unknown op {request['op']}")
+                reply = {"result": getattr(self.server.backend, request["op"])(*request["args"])}
+            except Exception as e:
+                reply = {"error": str(e)}
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+            self.wfile.flush()
+
+class StateServer(socketserver.ThreadingTCPServer):
+    """Serves an InMemoryStateBackend to the bot instances over TCP.
+
+    Clients must prove they know STATE_SERVER_SECRET before any op runs.
+    Requests travel in plain text; bind to a trusted network only.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, StateRequestHandler)
+        self.backend = InMemoryStateBackend()
+
+def run_state_server(address):
+    host, port = address.rsplit(":", 1)
+    server = StateServer((host, int(port)))
+    print(f"🗃️ State server listening on {host}:{port}")
+    server.serve_forever()
+
+def create_state_backend():
+    if CONFIG["STATE_BACKEND"] == "network":
+        return NetworkStateBackend(CONFIG["STATE_SERVER_ADDRESS"])
+    return InMemoryStateBackend()
+
+state_backend = create_state_backend()
+
 # === QUIZ COMPLETION TRACKING ===
+class CompletionRegistry:
+    """Completed users held as an in-memory set, backed by an append-only log.
+
+    Log lines are `+<user_id>`, `-<user_id>` and `active <0|1>`. Marking a
+    completion appends one line; resets rewrite a compacted log. `generation`
+    increases on every change so callers can tell when their view is stale.
+    With `shared` set (sharded mode) writers take an flock and every call
+    first applies lines appended by other processes (or reloads after a rewrite).
+    With a shared state backend the completed set and active flag live in the
+    backend (seeded once from the local log), and the log is kept as a local record.
+    """
+    def __init__(self, log_path, legacy_path, backend=None):
+        self.backend = backend if backend is not None and backend.shared else None
+        self.backend_seeded = False
+        self.log_path = log_path
+        self.legacy_path = legacy_path
+        self.lock = threading.RLock()
+        self.completed = None
+        self.quiz_active = True
+        self.generation = 0
+        self.shared = False
+        self.offset = 0  # Bytes of the log already applied
+        self.inode = None
+
+    def _ensure_loaded(self):
+        if self.completed is not None:
+            if self.shared:
+                self._catch_up()
+            return
+        self.completed = set()
+        self.quiz_active = True
+        if os.path.exists(self.log_path):
+            self.offset = 0
+            self.inode = os.stat(self.log_path).st_ino
+            self._read_new()
+        else:
+            # First start: seed the log from the legacy JSON file
+            try:
+                if os.path.exists(self.legacy_path) and os.path.getsize(self.legacy_path) > 0:
+                    with open(self.legacy_path, 'r', encoding='utf-8') as f:
+                        legacy = json.load(f)
+                    self.completed = {str(uid) for uid in legacy.get("completed_users", [])}
+                    self.quiz_active = legacy.get("quiz_active", True)
+            except Exception as e:
+                print(f"Warning: could not import {self.legacy_path}: {e}")
+            self._rewrite()
+        self.generation += 1
+
+    def _read_new(self):
+        """Apply complete lines past self.offset"""
+        with open(self.log_path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read()
+        complete = data[:data.rfind(b"\n") + 1]
+        for line in complete.decode('utf-8').splitlines():
+            self._apply(line.strip())
+        self.offset += len(complete)
+        return bool(complete)
+
+    def _catch_up(self):
+        try:
+            stat = os.stat(self.log_path)
+        except FileNotFoundError:
+            return
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            # Rewritten by another process (a reused inode shows up as a log shorter than our offset)
+            self.completed = None
+            self._ensure_loaded()
+        elif self._read_new():
+            self.generation += 1
+
+    @contextmanager
+    def _write_lock(self):
+        if not self.shared:
+            yield
+            return
+        import fcntl
+        with open(self.log_path + ".lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._ensure_loaded()
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _apply(self, line):
+        if line.startswith("+"):
+            self.completed.add(line[1:])
+        elif line.startswith("-"):
+            self.completed.discard(line[1:])
+        elif line.startswith("active "):
+            self.quiz_active = line[7:] == "1"
+
+    def _append(self, lines):
+        with open(self.log_path, 'ab') as f:
+            f.write("".join(line + "\n" for line in lines).encode('utf-8'))
+            # Under the write lock nobody else appends, so our end is the caught-up offset
+            self.offset = f.tell()
+        self.generation += 1
+
+    def _rewrite(self):
+        """Write a compacted log (current state only) and atomically swap it in"""
+        tmp_path = self.log_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(f"active {1 if self.quiz_active else 0}\n")
+            f.write("".join(f"+{uid}\n" for uid in self.completed))
+        os.replace(tmp_path, self.log_path)
+        stat = os.stat(self.log_path)
+        self.inode, self.offset = stat.st_ino, stat.st_size
+        self.generation += 1
+
+    def _seed_backend(self):
+        # Only the first instance to get here copies its local data to the backend
+        if self.backend_seeded:
+            return
+        if self.backend.compare_and_set("completion:seeded", 0, True):
+            self.backend.set_add_many("completion:users", sorted(self.completed))
+            self.backend.put("completion:active", self.quiz_active)
+        self.backend_seeded = True
+
+    def has(self, user_id):
+        with self.lock:
+            self._ensure_loaded()
+            if self.backend:
+                self._seed_backend()
+                return self.backend.set_contains("completion:users", str(user_id))
+            return str(user_id) in self.completed
+
+    def is_active(self):
+        with self.lock:
+            self._ensure_loaded()
+            if self.backend:
+                self._seed_backend()
+                active, _ = self.backend.get("completion:active")
+                return True if active is None else active
+            return self.quiz_active
+
+    def mark_many(self, user_ids):
+        """Mark users completed with a single append; returns how many were new"""
+        with self.lock, self._write_lock():
+            self._ensure_loaded()
+            if self.backend:
+                self._seed_backend()
+                new_ids = self.backend.set_add_many("completion:users", [str(uid) for uid in user_ids])
+            else:
+                new_ids = [str(uid) for uid in user_ids if str(uid) not in self.completed]
+                new_ids = list(dict.fromkeys(new_ids))
+            if new_ids:
+                self._append([f"+{uid}" for uid in new_ids])
+                self.completed.update(new_ids)
+            return len(new_ids)
+
+    def unmark(self, user_id):
+        with self.lock, self._write_lock():
+            self._ensure_loaded()
+            user_id_str = str(user_id)
+            if self.backend:
+                self._seed_backend()
+                self.backend.set_remove("completion:users", user_id_str)
+            if user_id_str in self.completed:
+                self._append([f"-{user_id_str}"])
+                self.completed.discard(user_id_str)
+
+    def set_active(self, status):
+        with self.lock, self._write_lock():
+            self._ensure_loaded()
+            if self.backend:
+                self._seed_backend()
+                self.backend.put("completion:active", bool(status))
+            self._append([f"active {1 if status else 0}"])
+            self.quiz_active = bool(status)
+
+    def reset(self, quiz_active=True):
+        """Clear all completions (new round / quiz reset)"""
+        with self.lock, self._write_lock():
+            self._ensure_loaded()
+            self.completed = set()
+            self.quiz_active = quiz_active
+            if self.backend:
+                self._seed_backend()
+                self.backend.delete("completion:users")
+                self.backend.put("completion:active", quiz_active)
+            self._rewrite()
+
+    def replace(self, data):
+        with self.lock, self._write_lock():
+            self._ensure_loaded()
+            self.completed = {str(uid) for uid in data.get("completed_users", [])}
+            self.quiz_active = data.get("quiz_active", True)
+            if self.backend:
+                self._seed_backend()
+                self.backend.delete("completion:users")
+                self.backend.set_add_many("completion:users", sorted(self.completed))
+                self.backend.put("completion:active", self.quiz_active)
+            self._rewrite()
+
+    def snapshot(self):
+        with self.lock:
+            self._ensure_loaded()
+            if self.backend:
+                return {"completed_users": sorted(self.backend.set_members("completion:users")),
+                        "quiz_active": self.is_active()}
+            return {"completed_users": sorted(self.completed), "quiz_active": self.quiz_active}
+
+completion_registry = CompletionRegistry(CONFIG["QUIZ_COMPLETION_LOG"], CONFIG["QUIZ_COMPLETION_FILE"], state_backend)
+
 def load_quiz_completion():
     """Load quiz completion data"""
     try:
-        if not os.path.exists(CONFIG["QUIZ_COMPLETION_FILE"]):
-            # Create default completion file if it doesn't exist
-            default_data = {"completed_users": [], "quiz_active": True}
-            with open(CONFIG["QUIZ_COMPLETION_FILE"], 'w', encoding='utf-8') as f:
-                json.dump(default_data, f, indent=2, ensure_ascii=False)
-            return default_data
-        
-        with open(CONFIG["QUIZ_COMPLETION_FILE"], 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return completion_registry.snapshot()
     except Exception as e:
         print(f"Error loading quiz completion: {e}")
         return {"completed_users": [], "quiz_active": True}
@@ -249,35 +1851,29 @@ def load_quiz_completion():
 def save_quiz_completion(data):
     """Save quiz completion data"""
     try:
-        with open(CONFIG["QUIZ_COMPLETION_FILE"], 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        completion_registry.replace(data)
     except Exception as e:
         print(f"Error saving quiz completion: {e}")
 
 def has_user_completed_quiz(user_id):
     """Check if user has already completed the quiz"""
-    completion_data = load_quiz_completion()
-    return str(user_id) in completion_data.get("completed_users", [])
+    return completion_registry.has(user_id)
 
 def mark_user_completed(user_id):
     """Mark user as having completed the quiz"""
-    completion_data = load_quiz_completion()
-    user_id_str = str(user_id)
-    
-    if user_id_str not in completion_data.get("completed_users", []):
-        completion_data.setdefault("completed_users", []).append(user_id_str)
-        save_quiz_completion(completion_data)
+    completion_registry.mark_many([user_id])
+
+def unmark_user_completed(user_id):
+    """Remove user from the completed set"""
+    completion_registry.unmark(user_id)
 
 def is_quiz_active():
     """Check if quiz is still active"""
-    completion_data = load_quiz_completion()
-    return completion_data.get("quiz_active", True)
+    return completion_registry.is_active()
 
 def set_quiz_active(status):
     """Set quiz active status (Admin only)"""
-    completion_data = load_quiz_completion()
-    completion_data["quiz_active"] = status
-    save_quiz_completion(completion_data)
+    completion_registry.set_active(status)
 
 # === SECURE QUESTION LOADING ===
 def load_questions():
@@ -355,45 +1951,244 @@ def is_admin(user_id):
     return user_id in CONFIG["ADMIN_IDS"]
 
 # === PARTICIPANT MANAGEMENT ===
-def load_participants():
-    # Ensure the file exists and recover from malformed content
-    if not os.path.exists(CONFIG["PARTICIPANTS_FILE"]):
+class ParticipantCache:
+    """Process-wide write-behind cache of the participants table.
+
+    Records are loaded once; mutations mark them dirty and a background
+    flusher writes dirty rows to SQLite in one batched transaction. With
+    `shared` set (sharded mode) mutations are written immediately and rows
+    another process changed are re-read using the data_changes log.
+
+    `stats_version` changes whenever a field shown on the global leaderboard
+    may have changed, so rendered leaderboards can be cached against it.
+    """
+    LEADERBOARD_FIELDS = ("name", "chat_ids", "total_score", "accuracy", "quizzes_completed", "has_completed_current_quiz")
+
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+        self.lock = threading.RLock()
+        self.records = None
+        self.dirty = set()
+        self.deleted = set()
+        self.flusher_thread = None
+        self.stop_event = threading.Event()
+        self.shared = False
+        self.version = None
+        self.stats_version = 0
+
+    def _ensure_loaded(self):
+        if self.records is not None and self.shared:
+            self._refresh()
+        if self.records is None:
+            with db_transaction() as conn:
+                self.version = read_data_version("participants", conn)
+                rows = conn.execute("SELECT * FROM participants").fetchall()
+            self.records = {row["user_id"]: participant_from_row(row) for row in rows}
+            self.stats_version += 1
+
+    def _refresh(self):
+        """Re-read only the rows other processes changed since our version"""
+        with db_transaction() as conn:
+            version = read_data_version("participants", conn)
+            if version == self.version:
+                return
+            changed = read_data_changes(conn, "participants", self.version, version)
+            if changed is None:
+                self.records = None
+                return
+            # Rows with unwritten local changes keep them; the next flush wins
+            changed -= self.dirty | self.deleted
+            rows = fetch_rows(conn, "participants", changed) if changed else []
+        fresh = {row["user_id"]: participant_from_row(row) for row in rows}
+        for uid in changed:
+            old = self.records.get(uid)
+            data = fresh.get(uid)
+            if data is None:
+                self.records.pop(uid, None)
+            else:
+                self.records[uid] = data
+            if (old is None) != (data is None) or (old is not None and any(
+                    old.get(field) != data.get(field) for field in self.LEADERBOARD_FIELDS)):
+                self.stats_version += 1
+        self.version = version
+
+    def current_stats_version(self):
+        with self.lock:
+            self._ensure_loaded()
+            return self.stats_version
+
+    def _advance(self, version):
+        # Stay current only if no other process wrote since our last load
+        with self.lock:
+            if self.version is not None and version == self.version + 1:
+                self.version = version
+
+    def _written(self):
+        if self.shared:
+            self.flush()
+
+    @staticmethod
+    def _copy(data):
+        copied = dict(data)
+        copied["chat_ids"] = list(data.get("chat_ids", []))
+        return copied
+
+    def get(self, user_id):
+        with self.lock:
+            self._ensure_loaded()
+            data = self.records.get(str(user_id))
+            return self._copy(data) if data is not None else None
+
+    def get_field(self, user_id, field, default=None):
+        """Read a single field without copying the record (answer hot path)"""
+        with self.lock:
+            self._ensure_loaded()
+            return self.records.get(str(user_id), {}).get(field, default)
+
+    def all(self):
+        with self.lock:
+            self._ensure_loaded()
+            return {uid: self._copy(data) for uid, data in self.records.items()}
+
+    def put(self, user_id, data):
+        user_id_str = str(user_id)
+        with self.lock:
+            self._ensure_loaded()
+            old = self.records.get(user_id_str)
+            if old is None or any(old.get(field) != data.get(field) for field in self.LEADERBOARD_FIELDS):
+                self.stats_version += 1
+            self.records[user_id_str] = self._copy(data)
+            self.dirty.add(user_id_str)
+            self.deleted.discard(user_id_str)
+            self._written()
+
+    def replace_all(self, participants_data):
+        with self.lock:
+            self._ensure_loaded()
+            new_ids = {str(uid) for uid in participants_data}
+            self.deleted.update(set(self.records) - new_ids)
+            self.records = {str(uid): self._copy(data) for uid, data in participants_data.items()}
+            self.stats_version += 1
+            self.dirty = set(new_ids)
+            self._written()
+
+    def update_each(self, func):
+        """Apply func(user_id_str, data) to every record in place and mark them all dirty"""
+        with self.lock:
+            self._ensure_loaded()
+            for user_id_str, data in self.records.items():
+                func(user_id_str, data)
+            self.stats_version += 1
+            self.dirty.update(self.records)
+            self._written()
+
+    def commit_updates(self, user_ids, func):
+        """Apply func(user_id_str, data) to the given existing records and write them in one transaction now"""
+        with self.lock:
+            self._ensure_loaded()
+            touched = [str(uid) for uid in user_ids if str(uid) in self.records]
+            for uid in touched:
+                func(uid, self.records[uid])
+            self.stats_version += 1
+            rows = [participant_to_row(uid, self.records[uid]) for uid in touched]
+            try:
+                with db_transaction() as conn:
+                    conn.executemany(PARTICIPANT_UPSERT_SQL, rows)
+                    version = bump_data_version(conn, "participants", touched)
+            except Exception:
+                # The records already changed in memory; leave them to the flusher's retries
+                self.dirty.update(touched)
+                raise
+            self._advance(version)
+            self.dirty.difference_update(touched)
+            return len(rows)
+
+    def flush(self):
+        """Write all dirty records to SQLite in a single transaction"""
+        with self.lock:
+            if not self.dirty and not self.deleted:
+                return 0
+            rows = [participant_to_row(uid, self.records[uid]) for uid in self.dirty if uid in self.records]
+            deleted = [(uid,) for uid in self.deleted]
+            self.dirty = set()
+            self.deleted = set()
         try:
-            with open(CONFIG["PARTICIPANTS_FILE"], 'w', encoding='utf-8') as f:
-                json.dump({}, f, indent=2, ensure_ascii=False)
+            with db_transaction() as conn:
+                if deleted:
+                    conn.executemany("DELETE FROM participants WHERE user_id = ?", deleted)
+                if rows:
+                    conn.executemany(PARTICIPANT_UPSERT_SQL, rows)
+                version = bump_data_version(conn, "participants", [row[0] for row in rows] + [uid for (uid,) in deleted])
+            self._advance(version)
+            return len(rows) + len(deleted)
         except Exception as e:
-            print(f"Error creating participants file: {e}")
-        return {}
+            print(f"Error flushing participants: {e}")
+            # Put the batch back so the next flush retries it
+            with self.lock:
+                self.dirty.update(row[0] for row in rows)
+                self.deleted.update(uid for (uid,) in deleted if uid not in self.records)
+            return 0
+
+    def start_flusher(self):
+        if self.flusher_thread and self.flusher_thread.is_alive():
+            return
+
+        def _flush_loop():
+            while not self.stop_event.wait(self.flush_interval):
+                self.flush()
+
+        self.stop_event.clear()
+        self.flusher_thread = threading.Thread(target=_flush_loop, daemon=True)
+        self.flusher_thread.start()
+
+    def shutdown(self):
+        """Stop the flusher and force a final flush"""
+        self.stop_event.set()
+        self.flush()
 
+participant_cache = ParticipantCache(CONFIG["PARTICIPANT_FLUSH_INTERVAL"])
+atexit.register(participant_cache.shutdown)
+
+def load_participants():
+    """Load all participants as {user_id_str: data}"""
     try:
-        with open(CONFIG["PARTICIPANTS_FILE"], 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return participant_cache.all()
     except Exception as e:
-        print(f"Warning: participants file malformed or empty, recreating: {e}")
-        try:
-            with open(CONFIG["PARTICIPANTS_FILE"], 'w', encoding='utf-8') as f:
-                json.dump({}, f, indent=2, ensure_ascii=False)
-        except Exception as ex:
-            print(f"Error rewriting participants file: {ex}")
+        print(f"Error loading participants: {e}")
         return {}
 
 def save_participants(participants_data):
+    """Replace all participant records (bulk admin operations only)"""
     try:
-        with open(CONFIG["PARTICIPANTS_FILE"], 'w', encoding='utf-8') as f:
-            json.dump(participants_data, f, indent=2, ensure_ascii=False)
+        participant_cache.replace_all(participants_data)
     except Exception as e:
         print(f"Error saving participants: {e}")
 
+def get_participant(user_id):
+    """Load a single participant record, or None"""
+    try:
+        return participant_cache.get(user_id)
+    except Exception as e:
+        print(f"Error loading participant {user_id}: {e}")
+        return None
+
+def save_participant(user_id, data):
+    """Insert or update a single participant record"""
+    try:
+        participant_cache.put(user_id, data)
+        return True
+    except Exception as e:
+        print(f"Error saving participant {user_id}: {e}")
+        return False
+
 def get_participant_name(user_id):
-    participants = load_participants()
-    return participants.get(str(user_id), {}).get("name", f"User_{user_id}")
+    return participant_cache.get_field(user_id, "name", f"User_{user_id}")
 
 def save_participant_info(user_id, name, chat_id=None):
-    participants = load_participants()
-    user_id_str = str(user_id)
+    participant = get_participant(user_id)
     
-    if user_id_str not in participants:
-        participants[user_id_str] = {
+    if participant is None:
+        participant = {
             "name": name,
             "first_seen": datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),  # Clean timestamp
             "chat_ids": [],
@@ -403,38 +2198,151 @@ def save_participant_info(user_id, name, chat_id=None):
             "has_completed_current_quiz": False
         }
     
-    if chat_id and chat_id not in participants[user_id_str].get("chat_ids", []):
-        participants[user_id_str].setdefault("chat_ids", []).append(chat_id)
+    if chat_id and chat_id not in participant.get("chat_ids", []):
+        participant.setdefault("chat_ids", []).append(chat_id)
     
-    participants[user_id_str]["last_seen"] = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")  # Clean timestamp
-    participants[user_id_str]["name"] = name
-    save_participants(participants)
+    participant["last_seen"] = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")  # Clean timestamp
+    participant["name"] = name
+    save_participant(user_id, participant)
 
-def update_participant_stats(user_id, score, correct_answers, total_questions):
-    """Update participant statistics after quiz"""
-    participants = load_participants()
-    user_id_str = str(user_id)
-    
-    if user_id_str not in participants:
-        return
-    
-    participants[user_id_str]["has_completed_current_quiz"] = True
-    participants[user_id_str]["total_score"] = participants[user_id_str].get("total_score", 0) + score
-    participants[user_id_str]["quizzes_completed"] = participants[user_id_str].get("quizzes_completed", 0) + 1
+def apply_quiz_result(participant, score, correct_answers, total_questions):
+    """Apply one finished quiz to a participant record in place"""
+    participant["has_completed_current_quiz"] = True
+    participant["total_score"] = participant.get("total_score", 0) + score
+    participant["quizzes_completed"] = participant.get("quizzes_completed", 0) + 1
     
     if total_questions > 0:
-        current_accuracy = participants[user_id_str].get("accuracy", 0)
+        current_accuracy = participant.get("accuracy", 0)
         new_accuracy = (correct_answers / total_questions) * 100
         
-        if participants[user_id_str]["quizzes_completed"] > 1:
-            total_quizzes = participants[user_id_str]["quizzes_completed"]
-            participants[user_id_str]["accuracy"] = round(((current_accuracy * (total_quizzes - 1)) + new_accuracy) / total_quizzes, 2)  # Rounded
+        if participant["quizzes_completed"] > 1:
+            total_quizzes = participant["quizzes_completed"]
+            participant["accuracy"] = round(((current_accuracy * (total_quizzes - 1)) + new_accuracy) / total_quizzes, 2)  # Rounded
         else:
-            participants[user_id_str]["accuracy"] = round(new_accuracy, 2)  # Rounded
+            participant["accuracy"] = round(new_accuracy, 2)  # Rounded
+
+def commit_quiz_results(results, total_questions):
+    """Persist a finished quiz in one batch.
+
+    results maps user_id -> live participant data (score, correct_answers).
+    All stats are written in one SQLite transaction and all completions in
+    one append to the completion log.
+    """
+    if not results:
+        return
+    by_id = {str(uid): pdata for uid, pdata in results.items()}
+    try:
+        participant_cache.commit_updates(
+            by_id.keys(),
+            lambda uid, data: apply_quiz_result(data, by_id[uid]["score"], by_id[uid]["correct_answers"], total_questions)
+        )
+    except Exception as e:
+        # The updated records stay dirty in the cache, so the flusher still persists them
+        print(f"Error committing quiz results: {e}")
+    completion_registry.mark_many(by_id.keys())
+
+def update_participant_stats(user_id, score, correct_answers, total_questions):
+    """Update participant statistics after quiz"""
+    participant = get_participant(user_id)
     
-    save_participants(participants)
+    if participant is None:
+        return
+    
+    apply_quiz_result(participant, score, correct_answers, total_questions)
+    save_participant(user_id, participant)
 
 # === STATE MANAGEMENT ===
+class _RankNode:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        self.width = [1] * level  # Positions skipped by each link
+
+class RankedScores:
+    """A chat's participants ordered by (-score, total_time_ns, user_id) in an indexable skip list.
+
+    update/remove and rank-of-user are O(log n) expected, top-K is O(log n + K).
+    Not thread-safe; the quiz runner updates it under state.answer_lock.
+    """
+    MAX_LEVEL = 24
+
+    def __init__(self):
+        self.head = _RankNode(None, self.MAX_LEVEL)
+        self.keys = {}  # user_id -> current key
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _path(self, key):
+        """Last node before `key` on every level, and the position of each"""
+        chain = [None] * self.MAX_LEVEL
+        positions = [0] * self.MAX_LEVEL
+        node, position = self.head, 0
+        for i in reversed(range(self.MAX_LEVEL)):
+            while node.next[i] is not None and node.next[i].key < key:
+                position += node.width[i]
+                node = node.next[i]
+            chain[i] = node
+            positions[i] = position
+        return chain, positions
+
+    def _insert(self, key):
+        chain, positions = self._path(key)
+        level = 1
+        while level < self.MAX_LEVEL and random.random() < 0.5:
+            level += 1
+        node = _RankNode(key, level)
+        position = positions[0] + 1
+        for i in range(level):
+            prev = chain[i]
+            node.next[i] = prev.next[i]
+            prev.next[i] = node
+            node.width[i] = prev.width[i] - (position - positions[i]) + 1
+            prev.width[i] = position - positions[i]
+        for i in range(level, self.MAX_LEVEL):
+            chain[i].width[i] += 1
+
+    def _remove(self, key):
+        chain, _ = self._path(key)
+        node = chain[0].next[0]
+        for i in range(len(node.next)):
+            chain[i].width[i] += node.width[i] - 1
+            chain[i].next[i] = node.next[i]
+        for i in range(len(node.next), self.MAX_LEVEL):
+            chain[i].width[i] -= 1
+
+    def update(self, user_id, score, total_time_ns):
+        old = self.keys.get(user_id)
+        if old is not None:
+            self._remove(old)
+        key = (-score, total_time_ns, user_id)
+        self.keys[user_id] = key
+        self._insert(key)
+
+    def remove(self, user_id):
+        key = self.keys.pop(user_id, None)
+        if key is not None:
+            self._remove(key)
+
+    def rank(self, user_id):
+        """1-based rank of the user, or None if not ranked"""
+        key = self.keys.get(user_id)
+        if key is None:
+            return None
+        _, positions = self._path(key)
+        return positions[0] + 1
+
+    def top(self, k=None):
+        """User ids of the best k participants (all when k is None), best first"""
+        result = []
+        node = self.head.next[0]
+        while node is not None and (k is None or len(result) < k):
+            result.append(node.key[2])
+            node = node.next[0]
+        return result
+
 class ChatQuizState:
     def __init__(self, chat_id):
         self.chat_id = chat_id
@@ -449,20 +2357,125 @@ class ChatQuizState:
             "correct_answers": 0
         })
         self.first_correct_for_question = {}
-        self.question_start_time_ns = None  # Nanoseconds
+        # Question timing uses time.monotonic_ns(); the wall-clock start only maps forwarded answers
+        self.question_start_ns = None
+        self.question_start_wall_ns = None
+        self.question_sent_ns = None  # When Telegram acknowledged the question message
+        self.question_timing = None  # This question's record in response_timer.history
         self.quiz_start_time_ns = None
+        self.run_id = None  # Identifies this quiz run in the state backend
+        self.started_by = None
+        self.resume_q = 0  # First question to ask (non-zero when resumed from a checkpoint)
         self.lock = threading.Lock()
         self.answered_users_per_question = set()
         self.question_message_id = None
-        self.countdown_message_id = None
-        self.countdown_thread = None
-        self.stop_countdown = False
+        self.results_committed = False  # Set once commit_quiz_results returned; the checkpoint may go then
         self.question_answered = False
-        self.answer_lock = threading.Lock()
+        self.question_answered_at = None  # time.monotonic() when question_answered was set
+        self.question_deadline = None  # time.monotonic() after which answers are refused
+        # Callback handlers only stamp answers and queue them; the quiz runner scores them
+        self.answer_queue = queue.SimpleQueue()
+        self.answer_ready = threading.Event()
+        self.answer_claims = {}  # (q_idx, user_id) -> claim token; dict.setdefault makes claiming atomic
+        self.on_answer_queued = None  # Extra wake-up hook used by the asyncio engine
+        self.answer_lock = threading.Lock()  # Held by the runner while scoring; readers take it to snapshot participants
+        self.ranking = RankedScores()  # Kept in step with participants by score_answer
+
+    def mark_question_answered(self, at=None):
+        """Everyone has answered (the last answer arrived at `at`): the quiz runner moves on"""
+        self.question_answered = True
+        self.question_answered_at = at if at is not None else time.monotonic()
+
+    def queue_answer(self, answer):
+        """Hand a stamped answer to the quiz runner (callback handler side, takes no locks)"""
+        self.answer_queue.put(answer)
+        self.answer_ready.set()
+        if self.on_answer_queued:
+            self.on_answer_queued()
+
+    def claim_answer(self, q_idx, user_id):
+        """True for the user's first answer to the question"""
+        token = object()
+        return self.answer_claims.setdefault((q_idx, user_id), token) is token
 
 chat_state = {}
 chat_state_lock = threading.Lock()
 
+# How long run_quiz takes to move on after the last answer arrives
+advance_stats = {"advances": 0, "total_latency": 0.0, "max_latency": 0.0}
+advance_stats_lock = threading.Lock()
+
+def record_advance_latency(latency):
+    with advance_stats_lock:
+        advance_stats["advances"] += 1
+        advance_stats["total_latency"] += latency
+        advance_stats["max_latency"] = max(advance_stats["max_latency"], latency)
+
+# Answers scored by the quiz runners, and answers that arrived after their question closed
+answer_intake_stats = {"scored": 0, "late": 0}
+
+# === RESPONSE TIMING ===
+class ResponseTimer:
+    """Monotonic nanosecond timings of questions and answers.
+
+    Each question records how long Telegram took to acknowledge it; answers
+    are timed from that acknowledgement. Each answer records when its
+    callback arrived and how long it waited to be scored. The most recent
+    questions are kept in `history` for analysis.
+    """
+    def __init__(self, history_size):
+        self.lock = threading.Lock()
+        self.history = deque(maxlen=history_size)
+        self.stats = {"questions": 0, "send_ack_ns": 0, "max_send_ack_ns": 0,
+                      "answers": 0, "processing_ns": 0, "max_processing_ns": 0}
+
+    def question_sent(self, state):
+        """The question message was acknowledged; answers are timed from now"""
+        sent_ns = time.monotonic_ns()
+        record = {
+            "chat_id": state.chat_id,
+            "run_id": state.run_id,
+            "q_idx": state.current_q,
+            "send_ack_ns": sent_ns - state.question_start_ns,
+            "answers": [],
+        }
+        with state.answer_lock:
+            state.question_sent_ns = sent_ns
+            state.question_timing = record
+        with self.lock:
+            self.history.append(record)
+            self.stats["questions"] += 1
+            self.stats["send_ack_ns"] += record["send_ack_ns"]
+            self.stats["max_send_ack_ns"] = max(self.stats["max_send_ack_ns"], record["send_ack_ns"])
+
+    def response_time(self, state, received_ns):
+        """Time from the question appearing to the answer's callback arriving"""
+        shown_ns = state.question_sent_ns if state.question_sent_ns is not None else state.question_start_ns
+        # A click can beat the send acknowledgement back to us
+        return max(0, received_ns - shown_ns)
+
+    def answer_scored(self, state, user_id, received_ns, response_time_ns):
+        processing_ns = time.monotonic_ns() - received_ns
+        with self.lock:
+            if state.question_timing is not None:
+                state.question_timing["answers"].append({
+                    "user_id": user_id,
+                    "received_ns": received_ns,
+                    "response_ns": response_time_ns,
+                    "processing_ns": processing_ns,
+                })
+            self.stats["answers"] += 1
+            self.stats["processing_ns"] += processing_ns
+            self.stats["max_processing_ns"] = max(self.stats["max_processing_ns"], processing_ns)
+
+    def recent(self, chat_id=None):
+        """Copies of the recorded questions, optionally for one chat"""
+        with self.lock:
+            return [dict(record, answers=list(record["answers"])) for record in self.history
+                    if chat_id is None or record["chat_id"] == chat_id]
+
+response_timer = ResponseTimer(CONFIG["TIMING_HISTORY"])
+
 def get_state(chat_id):
     if chat_id not in chat_state:
         with chat_state_lock:
@@ -472,16 +2485,12 @@ def get_state(chat_id):
 
 def clear_state(chat_id):
     """Enhanced state clearing with proper cleanup"""
+    release_quiz(chat_id)
     if chat_id in chat_state:
         with chat_state_lock:
             if chat_id in chat_state:
-                state = chat_state[chat_id]
                 # Stop any running countdown
-                if hasattr(state, 'stop_countdown'):
-                    state.stop_countdown = True
-                # Stop countdown thread if running
-                if state.countdown_thread and state.countdown_thread.is_alive():
-                    state.countdown_thread.join(timeout=1)
+                countdown_ticker.stop(chat_id)
                 del chat_state[chat_id]
                 print(f"✅ Cleared state for chat {chat_id}")
 
@@ -490,95 +2499,542 @@ def clear_all_states():
     with chat_state_lock:
         chat_ids = list(chat_state.keys())
         for chat_id in chat_ids:
-            state = chat_state[chat_id]
-            if hasattr(state, 'stop_countdown'):
-                state.stop_countdown = True
-            if state.countdown_thread and state.countdown_thread.is_alive():
-                state.countdown_thread.join(timeout=1)
+            countdown_ticker.stop(chat_id)
+            release_quiz(chat_id)
             del chat_state[chat_id]
         print(f"✅ Cleared all {len(chat_ids)} chat states")
 
+# Quiz records in the state backend: which instance runs each chat's quiz and which question is live
+def quiz_key(chat_id):
+    return f"quiz:{chat_id}"
+
+def answered_key(chat_id, run_id, q_idx):
+    return f"answered:{chat_id}:{run_id}:{q_idx}"
+
+def inbox_key(chat_id, run_id):
+    return f"inbox:{chat_id}:{run_id}"
+
+def claim_quiz(chat_id, run_id, expected_duration):
+    """Atomically record this instance as running the chat's quiz; False if another run is still live"""
+    record, version = state_backend.get(quiz_key(chat_id))
+    if record and record["running"] and record["expires_at"] > time.time():
+        return False
+    return state_backend.compare_and_set(quiz_key(chat_id), version, {
+        "running": True,
+        "node": CONFIG["NODE_ID"],
+        "run_id": run_id,
+        "current_q": -1,
+        "expires_at": time.time() + expected_duration,
+    })
+
+def update_quiz_record(chat_id, run_id, **changes):
+    """Compare-and-set update of the chat's quiz record; run_id=None matches any run"""
+    while True:
+        record, version = state_backend.get(quiz_key(chat_id))
+        if not record or (run_id is not None and record["run_id"] != run_id):
+            return False
+        if state_backend.compare_and_set(quiz_key(chat_id), version, dict(record, **changes)):
+            return True
+
+def release_quiz(chat_id, run_id=None):
+    try:
+        update_quiz_record(chat_id, run_id, running=False)
+    except Exception as e:
+        print(f"Error releasing quiz record for {chat_id}: {e}")
+
+def expected_quiz_duration(question_count):
+    # A crashed instance's claim expires after this; the queue wait is covered by the slack
+    return question_count * (CONFIG["QUESTION_TIME"] + CONFIG["QUESTION_TRANSITION_DELAY"]) + 600
+
+def forward_answer(chat_id, user_id, q_idx, ans_idx):
+    """Pass an answer to the instance running the chat's quiz; returns the callback text"""
+    # Monotonic clocks differ between hosts, so forwarded answers carry wall-clock time
+    received_wall_ns = time.time_ns()
+    record, _ = state_backend.get(quiz_key(chat_id))
+    if not record or not record["running"] or record["node"] == CONFIG["NODE_ID"]:
+        return "❌ Too late! Question time expired."
+    if q_idx != record["current_q"]:
+        return "❌ Invalid question!"
+    if not state_backend.set_add(answered_key(chat_id, record["run_id"], q_idx), str(user_id)):
+        return "❌ You already answered this question!"
+    state_backend.list_push(inbox_key(chat_id, record["run_id"]), {
+        "user_id": user_id,
+        "name": get_participant_name(user_id),
+        "q_idx": q_idx,
+        "ans_idx": ans_idx,
+        "received_wall_ns": received_wall_ns,
+    })
+    return "📨 Answer received!"
+
+def score_pending_answers(state):
+    """Score queued (and forwarded) answers in the order they were received; runs on the quiz runner only"""
+    answers = []
+    while True:
+        try:
+            answers.append(state.answer_queue.get_nowait())
+        except queue.Empty:
+            break
+    if state_backend.shared:
+        for answer in state_backend.list_drain(inbox_key(state.chat_id, state.run_id)):
+            if state.question_start_ns is None or answer["q_idx"] != state.current_q:
+                # No question of ours is live (e.g. finalizing a recovered quiz), so there's no clock to map onto
+                answer_intake_stats["late"] += 1
+                continue
+            # Map the forwarding instance's wall-clock stamp onto this question's monotonic clock
+            answer["received_ns"] = state.question_start_ns + answer.pop("received_wall_ns") - state.question_start_wall_ns
+            answers.append(answer)
+    if not answers:
+        return
+    answers.sort(key=lambda answer: answer["received_ns"])
+    any_correct = False
+    with state.answer_lock:
+        for answer in answers:
+            user_id = answer["user_id"]
+            # Accepted by the callback handler while the question was open, so still scored
+            # if the question closed before the runner got to it
+            if (not state.is_running or answer["q_idx"] != state.current_q
+                    or user_id in state.answered_users_per_question):
+                answer_intake_stats["late"] += 1
+                continue
+            response_time_ns = response_timer.response_time(state, answer["received_ns"])
+            if score_answer(state, user_id, answer["name"], answer["q_idx"], answer["ans_idx"], response_time_ns):
+                any_correct = True
+            response_timer.answer_scored(state, user_id, answer["received_ns"], response_time_ns)
+            answer_intake_stats["scored"] += 1
+        # The whole batch counts before deciding whether to advance
+        # (run_quiz stops the countdown and cleans up the question messages)
+        if (any_correct and not state.question_answered
+                and len(state.answered_users_per_question) >= len(state.participants)):
+            state.mark_question_answered(at=answers[-1]["received_ns"] / 1_000_000_000)
+
+def wait_question_done(state, timeout):
+    """Score answers until everyone has answered (True) or timeout passes (False)"""
+    deadline = time.monotonic() + timeout
+    state.question_deadline = deadline
+    while True:
+        state.answer_ready.clear()
+        score_pending_answers(state)
+        if state.question_answered:
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        if state_backend.shared:
+            # Forwarded answers arrive without a local wake-up
+            remaining = min(remaining, CONFIG["STATE_INBOX_POLL"])
+        state.answer_ready.wait(remaining)
+
+# === QUIZ CHECKPOINTS ===
+class QuizCheckpointer:
+    """Incremental checkpoints of running quizzes in SQLite.
+
+    begin_question and score_answer only mark what changed. A background
+    thread writes the changed quiz headers and participant rows every
+    CHECKPOINT_INTERVAL seconds in one transaction. The shuffled questions
+    are written once per run.
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()  # Orders flushes against discards
+        self.dirty_quizzes = set()
+        self.dirty_participants = defaultdict(set)
+        self.headers_written = set()
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def _ensure_started(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def mark_quiz(self, chat_id):
+        with self.lock:
+            self.dirty_quizzes.add(chat_id)
+            self._ensure_started()
+
+    def mark_participant(self, chat_id, user_id):
+        with self.lock:
+            self.dirty_participants[chat_id].add(user_id)
+            self._ensure_started()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        """Write everything marked since the last flush"""
+        with self.write_lock:
+            with self.lock:
+                quizzes, participants = self.dirty_quizzes, self.dirty_participants
+                self.dirty_quizzes, self.dirty_participants = set(), defaultdict(set)
+            headers, updates, rows = [], [], []
+            now = time.time()
+            for chat_id in quizzes | set(participants):
+                state = chat_state.get(chat_id)
+                if state is None or not state.is_running or state.run_id is None:
+                    continue
+                with state.answer_lock:
+                    if (chat_id, state.run_id) not in self.headers_written:
+                        questions = [{"q": q.q, "opts": q.opts, "correct_index": q.correct_index} for q in state.questions]
+                        headers.append((chat_id, state.run_id, state.started_by, json.dumps(questions, ensure_ascii=False),
+                                        state.current_q, state.quiz_start_time_ns, now, state.question_message_id))
+                    else:
+                        updates.append((state.current_q, state.question_message_id, now, chat_id, state.run_id))
+                    for uid in participants.get(chat_id, ()):
+                        pdata = state.participants.get(uid)
+                        if pdata is not None:
+                            rows.append((chat_id, state.run_id, uid, pdata["name"], pdata["score"], pdata["total_time_ns"],
+                                         pdata["correct_answers"], json.dumps(pdata["answers"])))
+            if not headers and not updates and not rows:
+                return 0
+            try:
+                with db_transaction() as conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO quiz_checkpoints (chat_id, run_id, started_by, questions, current_q, "
+                        "quiz_start_time_ns, updated_at, question_message_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", headers
+                    )
+                    conn.executemany(
+                        "UPDATE quiz_checkpoints SET current_q = ?, question_message_id = ?, updated_at = ? "
+                        "WHERE chat_id = ? AND run_id = ?", updates
+                    )
+                    conn.executemany("INSERT OR REPLACE INTO quiz_checkpoint_participants VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                self.headers_written.update((header[0], header[1]) for header in headers)
+            except Exception as e:
+                print(f"Error writing quiz checkpoints: {e}")
+                with self.lock:
+                    self.dirty_quizzes.update(quizzes)
+                    for chat_id, uids in participants.items():
+                        self.dirty_participants[chat_id].update(uids)
+                return 0
+            return len(headers) + len(updates) + len(rows)
+
+    def discard(self, chat_id, run_id):
+        """Drop a finished run's checkpoint"""
+        with self.write_lock:
+            with self.lock:
+                self.headers_written.discard((chat_id, run_id))
+            try:
+                with db_transaction() as conn:
+                    conn.execute("DELETE FROM quiz_checkpoints WHERE chat_id = ? AND run_id = ?", (chat_id, run_id))
+                    conn.execute("DELETE FROM quiz_checkpoint_participants WHERE chat_id = ? AND run_id = ?", (chat_id, run_id))
+            except Exception as e:
+                print(f"Error deleting quiz checkpoint for {chat_id}: {e}")
+
+    def shutdown(self):
+        self.stop_event.set()
+        self.flush()
+
+quiz_checkpointer = QuizCheckpointer(CONFIG["CHECKPOINT_INTERVAL"])
+atexit.register(quiz_checkpointer.shutdown)
+
+def recover_interrupted_quizzes():
+    """Resume (or finalize) quizzes that were still running when the process stopped"""
+    try:
+        with db_transaction() as conn:
+            headers = conn.execute("SELECT * FROM quiz_checkpoints").fetchall()
+            rows = conn.execute("SELECT * FROM quiz_checkpoint_participants").fetchall()
+    except Exception as e:
+        print(f"Error loading quiz checkpoints: {e}")
+        return 0
+    participants_by_run = defaultdict(list)
+    for row in rows:
+        participants_by_run[(row["chat_id"], row["run_id"])].append(row)
+
+    recovered = 0
+    for header in headers:
+        chat_id, run_id = header["chat_id"], header["run_id"]
+        if not owns_chat(chat_id):
+            continue
+        state = get_state(chat_id)
+        with state.lock:
+            state.questions = [Question(q=q["q"], opts=q["opts"], correct_index=q["correct_index"])
+                               for q in json.loads(header["questions"])]
+            state.run_id = run_id
+            state.started_by = header["started_by"]
+            state.quiz_start_time_ns = header["quiz_start_time_ns"]
+            state.current_q = header["current_q"]
+            state.is_running = True
+            for row in participants_by_run[(chat_id, run_id)]:
+                state.participants[row["user_id"]] = {
+                    "score": row["score"],
+                    "answers": {int(q_idx): answer for q_idx, answer in json.loads(row["answers"]).items()},
+                    "total_time_ns": row["total_time_ns"],
+                    "name": row["name"],
+                    "correct_answers": row["correct_answers"],
+                }
+                state.ranking.update(row["user_id"], row["score"], row["total_time_ns"])
+        # The header was written by the previous process; rewrite it under this one's bookkeeping
+        with quiz_checkpointer.lock:
+            quiz_checkpointer.headers_written.add((chat_id, run_id))
+        recovered += 1
+
+        # The interrupted question's buttons would still accept answers; remove that message
+        if header["question_message_id"] is not None:
+            delete_messages_bulk(chat_id, [header["question_message_id"]])
+
+        age = time.time() - header["updated_at"]
+        if CONFIG["CHECKPOINT_RECOVERY"] == "resume" and age <= CONFIG["CHECKPOINT_MAX_AGE"]:
+            state.resume_q = max(0, state.current_q)
+            expected_duration = expected_quiz_duration(len(state.questions) - state.resume_q)
+            if not update_quiz_record(chat_id, run_id, node=CONFIG["NODE_ID"], running=True,
+                                      expires_at=time.time() + expected_duration):
+                claim_quiz(chat_id, run_id, expected_duration)
+            print(f"♻️ Resuming quiz in chat {chat_id} at question {state.resume_q + 1}")
+            try:
+                msg = bot.send_message(chat_id,
+                    f"♻️ <b>The quiz bot restarted</b>\n\n"
+                    f"Scores were kept - resuming from question {state.resume_q + 1}/{len(state.questions)}.",
+                    parse_mode='HTML'
+                )
+                schedule_auto_delete(chat_id, msg.message_id)
+            except Exception as e:
+                print(f"Error announcing resumed quiz in {chat_id}: {e}")
+            quiz_runner_pool.submit(chat_id, state.started_by, announce=False)
+        else:
+            print(f"♻️ Finalizing interrupted quiz in chat {chat_id}")
+            try:
+                finish_quiz(chat_id, state, len(state.questions))
+            except Exception as e:
+                print(f"Error finalizing interrupted quiz in {chat_id}: {e}")
+            end_quiz(chat_id, state)
+    return recovered
+
 # === COUNTDOWN TIMER ===
-def start_countdown(chat_id, duration):
-    """Start a countdown timer that shows seconds remaining"""
-    state = get_state(chat_id)
-    state.stop_countdown = False
-    
-    def countdown():
-        remaining = duration
-        last_update_time = time.time()
-        
+def countdown_text(remaining):
+    if remaining > 0:
+        return f"⏰ Time remaining: **{remaining}s**"
+    return "⏰ **Time's up!**"
+
+class CountdownTicker:
+    """One shared thread driving the countdown messages of every running quiz.
+
+    Each question's countdown is sent once and then edited only at the seconds
+    listed in COUNTDOWN_MARKS. A failed edit is logged and the next mark still fires.
+    Sends and edits are cosmetic (never wait for rate-limit tokens), so one
+    throttled group can't hold up the pool; a mark that is no longer current
+    by the time a worker gets to it is dropped.
+    """
+    def __init__(self, workers):
+        self.cond = threading.Condition()
+        self.timers = {}
+        self.heap = []
+        self.seq = itertools.count()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="countdown")
+        self.thread = None
+        self.stats = {"edits": 0, "failed": 0, "late": 0}
+
+    def _count(self, key):
+        with self.cond:
+            self.stats[key] += 1
+
+    def start(self, chat_id, duration):
+        timer = {"message_id": None, "duration": duration}
+        deadline = time.monotonic() + duration
+        with self.cond:
+            self.timers[chat_id] = timer
+            for mark in set(CONFIG["COUNTDOWN_MARKS"]):
+                if 0 <= mark < duration:
+                    heapq.heappush(self.heap, (deadline - mark, next(self.seq), chat_id, timer, mark))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+            self.cond.notify()
+        self.executor.submit(self._send, chat_id, timer)
+
+    def stop(self, chat_id):
+        """Stop the chat's countdown and return its message ID (None if it was never sent)"""
+        with self.cond:
+            timer = self.timers.pop(chat_id, None)
+        return timer["message_id"] if timer else None
+
+    def active(self, chat_id, timer):
+        with self.cond:
+            return self.timers.get(chat_id) is timer
+
+    def _run(self):
+        with self.cond:
+            while True:
+                if not self.heap:
+                    self.cond.wait()
+                    continue
+                delay = self.heap[0][0] - time.monotonic()
+                if delay > 0:
+                    self.cond.wait(delay)
+                    continue
+                due, _, chat_id, timer, mark = heapq.heappop(self.heap)
+                # Stopped countdowns leave their marks in the heap; they are dropped here
+                if self.timers.get(chat_id) is timer:
+                    self.executor.submit(self._edit, chat_id, timer, mark, due)
+
+    def _send(self, chat_id, timer):
+        if not self.active(chat_id, timer):
+            return
         try:
-            countdown_msg = bot.send_message(chat_id, f"⏰ Time remaining: **{remaining}s**", parse_mode='Markdown')
-            state.countdown_message_id = countdown_msg.message_id
-            # ⚡ CHANGED: Auto-delete countdown message AFTER the full duration
-            schedule_auto_delete(chat_id, countdown_msg.message_id, duration)
-        except:
+            msg = bot.send_message(chat_id, countdown_text(timer["duration"]), parse_mode='Markdown', cosmetic=True)
+        except Exception as e:
+            print(f"Error sending countdown to {chat_id}: {e}")
             return
-        
-        while remaining > 0 and not state.stop_countdown:
-            if state.question_answered:
-                break
-                
-            current_time = time.time()
-            if current_time - last_update_time >= 1:
-                remaining -= 1
-                last_update_time = current_time
-                
-                try:
-                    if remaining > 0:
-                        bot.edit_message_text(
-                            chat_id=chat_id,
-                            message_id=state.countdown_message_id,
-                            text=f"⏰ Time remaining: **{remaining}s**",
-                            parse_mode='Markdown'
-                        )
-                    else:
-                        bot.edit_message_text(
-                            chat_id=chat_id,
-                            message_id=state.countdown_message_id,
-                            text="⏰ **Time's up!**",
-                            parse_mode='Markdown'
-                        )
-                except:
-                    break
-                
-            time.sleep(0.1)
-    
-    state.countdown_thread = threading.Thread(target=countdown)
-    state.countdown_thread.start()
+        if msg is None:
+            return
+        # Auto-delete the countdown message after the full duration, even if it was stopped meanwhile
+        schedule_auto_delete(chat_id, msg.message_id, timer["duration"])
+        with self.cond:
+            timer["message_id"] = msg.message_id
+
+    def _edit(self, chat_id, timer, mark, due):
+        # Checked right before the call: the countdown may have stopped, or the
+        # next mark come due, while this edit waited for a worker
+        if timer["message_id"] is None or not self.active(chat_id, timer):
+            return
+        if time.monotonic() - due >= 1:
+            self._count("late")
+            return
+        try:
+            edited = bot.edit_message_text(
+                chat_id=chat_id,
+                message_id=timer["message_id"],
+                text=countdown_text(mark),
+                parse_mode='Markdown',
+                cosmetic=True
+            )
+            if edited is not None:
+                self._count("edits")
+        except Exception as e:
+            self._count("failed")
+            print(f"Error updating countdown for {chat_id}: {e}")
 
-def stop_countdown(chat_id):
-    """Stop the countdown timer"""
-    state = get_state(chat_id)
-    state.stop_countdown = True
-    if state.countdown_thread and state.countdown_thread.is_alive():
-        state.countdown_thread.join(timeout=1)
-    
-    if state.countdown_message_id:
+countdown_ticker = CountdownTicker(CONFIG["OUTBOUND_WORKERS"])
+
+def start_countdown(chat_id, duration):
+    """Start a countdown timer that shows seconds remaining"""
+    countdown_ticker.start(chat_id, duration)
+
+def stop_countdown(chat_id, delete=True):
+    """Stop the countdown timer. With delete=False the countdown message ID is returned for batched deletion."""
+    message_id = countdown_ticker.stop(chat_id)
+    if message_id and delete:
         try:
-            bot.delete_message(chat_id, state.countdown_message_id)
+            bot.delete_message(chat_id, message_id)
         except:
             pass
-        state.countdown_message_id = None
+        return None
+    return message_id
+
+# === LIVE SCOREBOARD ===
+def render_live_points(state):
+    """Render the Live Points text (top LIVE_SCOREBOARD_TOP) for a chat; caller holds state.answer_lock"""
+    leaderboard = "🏅 <b>Live Points</b>\n"
+    top = state.ranking.top(CONFIG["LIVE_SCOREBOARD_TOP"])
+    for i, uid in enumerate(top, 1):
+        pdata = state.participants[uid]
+        leaderboard += f"{i}. {pdata['name']}: <b>{pdata['score']}</b> pts\n"
+    if len(state.ranking) > len(top):
+        leaderboard += f"<i>…and {len(state.ranking) - len(top)} more</i>\n"
+    return leaderboard
+
+class LiveScoreboard:
+    """One Live Points message per chat, edited at most once per LIVE_SCOREBOARD_INTERVAL.
+
+    Answers only mark the chat dirty; a single thread coalesces bursts and
+    hands at most one update per chat at a time to a small worker pool.
+    """
+    def __init__(self, interval, workers):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.boards = {}
+        self.wakeup = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="live-scoreboard")
+        self.thread = None
+
+    def mark_dirty(self, chat_id):
+        with self.lock:
+            board = self.boards.setdefault(chat_id, {
+                "message_id": None, "text": None, "dirty": False, "busy": False, "last_update": float("-inf")
+            })
+            board["dirty"] = True
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+        self.wakeup.set()
+
+    def close(self, chat_id):
+        """Forget the chat's scoreboard; its message is auto-deleted like other quiz messages"""
+        with self.lock:
+            board = self.boards.pop(chat_id, None)
+        if board and board["message_id"]:
+            schedule_auto_delete(chat_id, board["message_id"])
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(self.interval / 4 if self.boards else None)
+            self.wakeup.clear()
+            now = time.monotonic()
+            with self.lock:
+                for chat_id, board in self.boards.items():
+                    if board["dirty"] and not board["busy"] and now - board["last_update"] >= self.interval:
+                        board["dirty"] = False
+                        board["busy"] = True
+                        self.executor.submit(self._update, chat_id, board)
+
+    def _update(self, chat_id, board):
+        try:
+            state = chat_state.get(chat_id)
+            if state is None:
+                return
+            with state.answer_lock:
+                text = render_live_points(state)
+            if text == board["text"]:
+                return
+            if board["message_id"] is None:
+                msg = bot.send_message(chat_id, text, parse_mode='HTML', cosmetic=True)
+                if msg is None:
+                    board["dirty"] = True  # Shed by the rate limiter; try again next interval
+                    return
+                board["message_id"] = msg.message_id
+                with self.lock:
+                    closed = self.boards.get(chat_id) is not board
+                if closed:
+                    schedule_auto_delete(chat_id, msg.message_id)
+            elif bot.edit_message_text(text, chat_id, board["message_id"], parse_mode='HTML', cosmetic=True) is None:
+                board["dirty"] = True
+                return
+            board["text"] = text
+        except Exception as e:
+            print(f"Error updating live scoreboard for {chat_id}: {e}")
+        finally:
+            board["last_update"] = time.monotonic()
+            board["busy"] = False
+
+live_scoreboard = LiveScoreboard(CONFIG["LIVE_SCOREBOARD_INTERVAL"], CONFIG["OUTBOUND_WORKERS"])
 
 # === LEADERBOARD MANAGEMENT ===
 class LeaderboardManager:
     def __init__(self):
         self.lock = threading.Lock()
+        # Global leaderboards, rebuilt only when participant_cache.stats_version changes
+        self.global_version = None
+        self.global_entries = {}  # chat_id -> entries sorted by accuracy, then score
+        self.global_text = {}  # chat_id -> rendered HTML
     
-    def show_final_leaderboard(self, chat_id, participants_data, questions_count):
+    def show_final_leaderboard(self, chat_id, participants_data, questions_count, ranking=None):
         """Show final leaderboard after all questions are completed"""
         with self.lock:
             if not participants_data:
-                msg = bot.send_message(chat_id, "🏆 <b>Final Leaderboard</b> 🏆\n\nNo participants completed the quiz.", parse_mode='HTML')
+                msg = bot.send_message(chat_id, "🏆 <b>Final Leaderboard</b> 🏆\n\nNo participants completed the quiz.",
+                                       parse_mode='HTML', critical=True)
                 schedule_auto_delete(chat_id, msg.message_id)
                 return
             
-            sorted_participants = sorted(
-                [(uid, data) for uid, data in participants_data.items() if data['answers']],
-                key=lambda kv: (-kv[1]['score'], kv[1]['total_time_ns'])  # Nanosecond precision for tie-breaking
-            )
+            if ranking is not None:
+                # Already ordered by (-score, total_time_ns) while the quiz ran
+                sorted_participants = [(uid, participants_data[uid]) for uid in ranking.top()
+                                       if participants_data[uid]['answers']]
+            else:
+                sorted_participants = sorted(
+                    [(uid, data) for uid, data in participants_data.items() if data['answers']],
+                    key=lambda kv: (-kv[1]['score'], kv[1]['total_time_ns'])  # Nanosecond precision for tie-breaking
+                )
             
             text = "🏆 <b>QUIZ COMPLETED - FINAL LEADERBOARD</b> 🏆\n\n"
             
@@ -587,54 +3043,75 @@ class LeaderboardManager:
                 accuracy = (pdata['correct_answers'] / questions_count) * 100 if questions_count > 0 else 0
                 total_time_seconds = pdata['total_time_ns'] / 1_000_000_000  # Convert to seconds for display
                 
-                text += f"{rank_emoji} <b>{i}.</b> {pdata['name']}\n"
-                text += f"   ⭐ Score: <b>{pdata['score']}</b> | 📊 Accuracy: <b>{accuracy:.1f}%</b>\n"
-                text += f"   ⏱ Total Time: <b>{total_time_seconds:.2f}s</b>\n"
-                text += f"   ✅ Correct: <b>{pdata['correct_answers']}/{questions_count}</b>\n\n"
-            
-            msg = bot.send_message(chat_id, text, parse_mode='HTML')
-            schedule_auto_delete(chat_id, msg.message_id)
-            return text
-    
-    def show_global_leaderboard(self, chat_id):
-        """Show global leaderboard with all participants sorted by accuracy"""
-        with self.lock:
-            participants_data = load_participants()
-            
-            chat_participants = []
-            for user_id_str, data in participants_data.items():
-                if chat_id in data.get("chat_ids", []) and data.get("has_completed_current_quiz", False):
-                    chat_participants.append({
-                        "user_id": int(user_id_str),
-                        "name": data.get("name", f"User_{user_id_str}"),
-                        "total_score": data.get("total_score", 0),
-                        "accuracy": data.get("accuracy", 0),
-                        "quizzes_completed": data.get("quizzes_completed", 0)
-                    })
-            
-            chat_participants.sort(key=lambda x: (-x["accuracy"], -x["total_score"]))
-            
-            if not chat_participants:
-                msg = bot.send_message(chat_id, "🏆 <b>Global Leaderboard</b> 🏆\n\nNo participants have completed the current quiz yet!", parse_mode='HTML')
-                schedule_auto_delete(chat_id, msg.message_id)
-                return
-            
-            text = "🏆 <b>Global Leaderboard</b> 🏆\n\n"
-            text += "<i>Sorted by Accuracy (Highest to Lowest)</i>\n\n"
-            
-            for i, participant in enumerate(chat_participants):
-                rank_emoji = self.get_rank_emoji(i + 1)
-                accuracy_str = f"📊 {participant['accuracy']:.1f}%"
-                score_str = f"⭐ {participant['total_score']}"
-                quizzes_str = f"🎯 {participant['quizzes_completed']}"
-                
-                text += f"{rank_emoji} <b>{i + 1}.</b> {participant['name']}\n"
-                text += f"   {accuracy_str} | {score_str} | {quizzes_str} quizzes\n\n"
+                text += f"{rank_emoji} <b>{i}.</b> {pdata['name']}\n"
+                text += f"   ⭐ Score: <b>{pdata['score']}</b> | 📊 Accuracy: <b>{accuracy:.1f}%</b>\n"
+                text += f"   ⏱ Total Time: <b>{total_time_seconds:.2f}s</b>\n"
+                text += f"   ✅ Correct: <b>{pdata['correct_answers']}/{questions_count}</b>\n\n"
             
-            msg = bot.send_message(chat_id, text, parse_mode='HTML')
+            msg = bot.send_message(chat_id, text, parse_mode='HTML', critical=True)
             schedule_auto_delete(chat_id, msg.message_id)
             return text
     
+    def _refresh_global_entries(self):
+        """Re-index completed participants by chat in one pass if their stats changed; caller holds self.lock"""
+        version = participant_cache.current_stats_version()
+        if version == self.global_version:
+            return
+        entries = defaultdict(list)
+        for user_id_str, data in load_participants().items():
+            if not data.get("has_completed_current_quiz", False):
+                continue
+            entry = {
+                "user_id": int(user_id_str),
+                "name": data.get("name", f"User_{user_id_str}"),
+                "total_score": data.get("total_score", 0),
+                "accuracy": data.get("accuracy", 0),
+                "quizzes_completed": data.get("quizzes_completed", 0)
+            }
+            for member_chat_id in set(data.get("chat_ids", [])):
+                entries[member_chat_id].append(entry)
+        for chat_participants in entries.values():
+            chat_participants.sort(key=lambda x: (-x["accuracy"], -x["total_score"]))
+        self.global_entries = dict(entries)
+        self.global_text = {}
+        self.global_version = version
+
+    def global_leaderboard_text(self, chat_id):
+        """Rendered global leaderboard for a chat, or None if nobody there has completed the quiz"""
+        with self.lock:
+            self._refresh_global_entries()
+            if chat_id not in self.global_text:
+                chat_participants = self.global_entries.get(chat_id)
+                self.global_text[chat_id] = self.render_global_leaderboard(chat_participants) if chat_participants else None
+            return self.global_text[chat_id]
+
+    def show_global_leaderboard(self, chat_id):
+        """Show global leaderboard with all participants sorted by accuracy"""
+        text = self.global_leaderboard_text(chat_id)
+        if text is None:
+            msg = bot.send_message(chat_id, "🏆 <b>Global Leaderboard</b> 🏆\n\nNo participants have completed the current quiz yet!", parse_mode='HTML')
+            schedule_auto_delete(chat_id, msg.message_id)
+            return
+
+        msg = bot.send_message(chat_id, text, parse_mode='HTML')
+        schedule_auto_delete(chat_id, msg.message_id)
+        return text
+
+    def render_global_leaderboard(self, chat_participants):
+        """Render the global leaderboard HTML for a chat's sorted entries"""
+        text = "🏆 <b>Global Leaderboard</b> 🏆\n\n"
+        text += "<i>Sorted by Accuracy (Highest to Lowest)</i>\n\n"
+        
+        for i, participant in enumerate(chat_participants):
+            rank_emoji = self.get_rank_emoji(i + 1)
+            accuracy_str = f"📊 {participant['accuracy']:.1f}%"
+            score_str = f"⭐ {participant['total_score']}"
+            quizzes_str = f"🎯 {participant['quizzes_completed']}"
+            
+            text += f"{rank_emoji} <b>{i + 1}.</b> {participant['name']}\n"
+            text += f"   {accuracy_str} | {score_str} | {quizzes_str} quizzes\n\n"
+        return text
+    
     def get_rank_emoji(self, rank):
         if rank == 1: return "🥇"
         if rank == 2: return "🥈"
@@ -886,8 +3363,7 @@ def handle_myinfo(message):
     user_id = message.from_user.id
     participant_name = get_participant_name(user_id)
     
-    participants = load_participants()
-    user_data = participants.get(str(user_id), {})
+    user_data = get_participant(user_id) or {}
     
     info_text = f"📊 <b>Your Information</b>\n\n"
     info_text += f"👤 Name: <b>{participant_name}</b>\n"
@@ -1002,14 +3478,10 @@ def handle_reset_all_devices(message):
     
     try:
         # Reset device fingerprints
-        fingerprints = {}
-        with open(CONFIG["DEVICE_FINGERPRINT_FILE"], 'w', encoding='utf-8') as f:
-            json.dump(fingerprints, f, indent=2, ensure_ascii=False)
+        save_device_fingerprints({})
         
-        # Clean up all device ID files
-        for file in os.listdir('.'):
-            if file.startswith('device_id_') and file.endswith('.txt'):
-                os.remove(file)
+        # Clean up all stored device IDs
+        clear_device_ids()
         
         msg = bot.send_message(
             message.chat.id,
@@ -1040,16 +3512,11 @@ def handle_fix_devices(message):
     
     try:
         # Clear all device fingerprints
-        fingerprints = {}
-        with open(CONFIG["DEVICE_FINGERPRINT_FILE"], 'w', encoding='utf-8') as f:
-            json.dump(fingerprints, f, indent=2, ensure_ascii=False)
+        save_device_fingerprints({})
         
-        # Clean up all device ID files
-        for file in os.listdir('.'):
-            if file.startswith('device_id_') and file.endswith('.txt'):
-                os.remove(file)
-            elif file == "device_id.txt":
-                os.remove(file)
+        # Clean up all stored device IDs and the old shared device ID file
+        clear_device_ids()
+        cleanup_shared_device_id()
         
         msg = bot.send_message(
             message.chat.id,
@@ -1097,30 +3564,19 @@ def reset_all_quiz_data():
     """Completely reset all quiz data for new round"""
     try:
         # 1. Reset quiz completion data
-        completion_data = {
-            "completed_users": [],
-            "quiz_active": True
-        }
-        with open(CONFIG["QUIZ_COMPLETION_FILE"], 'w', encoding='utf-8') as f:
-            json.dump(completion_data, f, indent=2, ensure_ascii=False)
+        completion_registry.reset(quiz_active=True)
         
         # 2. Reset participant data (keep names but reset scores and completion)
-        participants = load_participants()
-        for user_id, data in participants.items():
+        now = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+
+        def _reset(user_id, data):
             # Keep name and basic info, reset everything else
-            participants[user_id] = {
-                "name": data.get("name", f"User_{user_id}"),
-                "first_seen": data.get("first_seen", datetime.now().strftime("%Y-%m-%dT%H:%M:%S")),
-                "chat_ids": data.get("chat_ids", []),
-                "total_score": 0,
-                "quizzes_completed": 0,
-                "accuracy": 0,
-                "has_completed_current_quiz": False,
-                "last_seen": datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
-            }
-        
-        with open(CONFIG["PARTICIPANTS_FILE"], 'w', encoding='utf-8') as f:
-            json.dump(participants, f, indent=2, ensure_ascii=False)
+            data.setdefault("name", f"User_{user_id}")
+            data.setdefault("first_seen", now)
+            data.update(total_score=0, quizzes_completed=0, accuracy=0,
+                        has_completed_current_quiz=False, last_seen=now)
+
+        participant_cache.update_each(_reset)
         
         # 3. Clear all active states
         clear_all_states()
@@ -1284,18 +3740,7 @@ def handle_admin_devices(call):
     stats_text += f"• Device Change Allowed: <b>{'✅ YES' if CONFIG['ALLOW_DEVICE_CHANGE'] else '❌ NO'}</b>\n\n"
     
     # Show device sharing detection
-    device_sharing_count = 0
-    device_users_map = {}
-    
-    for uid, data in fingerprints.items():
-        fingerprint = data.get("fingerprint")
-        if fingerprint not in device_users_map:
-            device_users_map[fingerprint] = []
-        device_users_map[fingerprint].append(uid)
-    
-    for fingerprint, users in device_users_map.items():
-        if len(users) > 1:
-            device_sharing_count += 1
+    device_sharing_count = count_shared_fingerprints()
     
     stats_text += f"• Devices with Multiple Users: <b>{device_sharing_count}</b>\n"
     
@@ -1407,8 +3852,43 @@ def show_admin_stats(call):
     
     # State information
     stats_text += f"\n🔍 <b>System State:</b>\n"
+    stats_text += f"   • State Backend: <b>{CONFIG['STATE_BACKEND']}</b> (instance <code>{CONFIG['NODE_ID']}</code>)\n"
+    if CONFIG.get("SHARD_INDEX") is not None:
+        stats_text += f"   • Shard Worker: <b>{CONFIG['SHARD_INDEX'] + 1}/{CONFIG['SHARD_WORKERS']}</b> (quiz state below is this worker's chats only)\n"
     stats_text += f"   • Active Quiz Chats: <b>{len(chat_state)}</b>\n"
     stats_text += f"   • Active Admin Sessions: <b>{len(admin_edit_state)}</b>\n"
+    stats_text += f"   • Pending Auto-Deletes: <b>{auto_delete_scheduler.pending_count()}</b>\n"
+    stats_text += f"   • Delete API Calls Saved: <b>{delete_stats['api_calls_saved']}</b>\n"
+    stats_text += f"   • Queued Outbound Messages: <b>{outbound_queue.pending_count()}</b> (coalesced: <b>{outbound_queue.stats['coalesced']}</b>, overflow dropped: <b>{outbound_queue.stats['overflow_dropped']}</b>)\n"
+    limiter_stats = outbound_limiter.stats
+    stats_text += (f"   • Outbound Calls: <b>{limiter_stats['calls']}</b> | Throttled: <b>{limiter_stats['throttled']}</b> | "
+                   f"Retried: <b>{limiter_stats['retried']}</b> | Dropped: <b>{limiter_stats['dropped']}</b> | "
+                   f"Shed: <b>{limiter_stats['shed']}</b>\n")
+    with advance_stats_lock:
+        advances = advance_stats["advances"]
+        avg_advance_ms = advance_stats["total_latency"] / advances * 1000 if advances else 0
+        max_advance_ms = advance_stats["max_latency"] * 1000
+    stats_text += f"   • Answers Scored: <b>{answer_intake_stats['scored']}</b> (late: <b>{answer_intake_stats['late']}</b>)\n"
+    with response_timer.lock:
+        ts = dict(response_timer.stats)
+    avg_send_ms = ts["send_ack_ns"] / ts["questions"] / 1e6 if ts["questions"] else 0
+    avg_processing_ms = ts["processing_ns"] / ts["answers"] / 1e6 if ts["answers"] else 0
+    stats_text += (f"   • Question Send Ack: avg <b>{avg_send_ms:.1f}ms</b>, max <b>{ts['max_send_ack_ns'] / 1e6:.1f}ms</b> | "
+                   f"Answer Processing: avg <b>{avg_processing_ms:.2f}ms</b>, max <b>{ts['max_processing_ns'] / 1e6:.2f}ms</b>\n")
+    stats_text += f"   • Early Advances: <b>{advances}</b> (latency avg <b>{avg_advance_ms:.1f}ms</b>, max <b>{max_advance_ms:.1f}ms</b>)\n"
+    active_quizzes, queued_quizzes = quiz_runner_pool.counts()
+    qs = quiz_runner_pool.stats
+    stats_text += (f"   • Running Quizzes: <b>{active_quizzes}</b>/{quiz_runner_pool.max_active} | Queued: <b>{queued_quizzes}</b> "
+                   f"(peak <b>{qs['peak_active']}</b>/<b>{qs['peak_queued']}</b>)\n")
+    if async_engine.running:
+        es = async_engine.stats
+        stats_text += (f"   • Asyncio Engine: <b>{len(asyncio.all_tasks(async_engine.loop))}</b> tasks | Quizzes run: <b>{es['quizzes']}</b> | "
+                       f"Countdown edits: <b>{es['countdown_edits']}</b> (failed: <b>{es['countdown_failed']}</b>)\n")
+    if CONFIG["UPDATE_MODE"] == "webhook":
+        wh = update_dispatcher.stats
+        stats_text += f"   • Webhook Updates: <b>{wh['received']}</b> | Rejected: <b>{wh['rejected']}</b> | Failed: <b>{wh['failed']}</b>\n"
+    stats_text += (f"   • Countdown Edits: <b>{countdown_ticker.stats['edits']}</b> (failed: <b>{countdown_ticker.stats['failed']}</b>, "
+                   f"late: <b>{countdown_ticker.stats['late']}</b>)\n")
     
     bot.edit_message_text(
         stats_text,
@@ -1500,14 +3980,12 @@ def handle_edit_user_select(call):
     """Handle selection of user to edit"""
     try:
         user_id_str = call.data.split("_")[2]
-        participants = load_participants()
+        user_data = get_participant(user_id_str)
         
-        if user_id_str not in participants:
+        if user_data is None:
             bot.answer_callback_query(call.id, "❌ User not found!")
             return
         
-        user_data = participants[user_id_str]
-        
         # Create detailed user info with editing options
         text = f"👤 <b>Editing User: {user_data.get('name', 'Unknown')}</b>\n\n"
         text += f"🆔 User ID: <code>{user_id_str}</code>\n"
@@ -1559,8 +4037,8 @@ def handle_user_edit_action(call):
         action = f"{action_parts[1]}_{action_parts[2]}"  # edit_name, edit_score, etc.
         user_id_str = action_parts[3]
         
-        participants = load_participants()
-        if user_id_str not in participants:
+        participant = get_participant(user_id_str)
+        if participant is None:
             bot.answer_callback_query(call.id, "❌ User not found!")
             return
         
@@ -1575,7 +4053,7 @@ def handle_user_edit_action(call):
         if action == "edit_name":
             bot.edit_message_text(
                 f"✏️ <b>Edit Name for User {user_id_str}</b>\n\n"
-                f"Current name: {participants[user_id_str].get('name', 'Unknown')}\n\n"
+                f"Current name: {participant.get('name', 'Unknown')}\n\n"
                 "Send the new name:",
                 call.message.chat.id,
                 call.message.message_id,
@@ -1585,7 +4063,7 @@ def handle_user_edit_action(call):
         elif action == "edit_score":
             bot.edit_message_text(
                 f"⭐ <b>Edit Score for User {user_id_str}</b>\n\n"
-                f"Current score: {participants[user_id_str].get('total_score', 0)}\n\n"
+                f"Current score: {participant.get('total_score', 0)}\n\n"
                 "Send the new score (number):",
                 call.message.chat.id,
                 call.message.message_id,
@@ -1595,7 +4073,7 @@ def handle_user_edit_action(call):
         elif action == "edit_accuracy":
             bot.edit_message_text(
                 f"📊 <b>Edit Accuracy for User {user_id_str}</b>\n\n"
-                f"Current accuracy: {participants[user_id_str].get('accuracy', 0):.1f}%\n\n"
+                f"Current accuracy: {participant.get('accuracy', 0):.1f}%\n\n"
                 "Send the new accuracy (0-100):",
                 call.message.chat.id,
                 call.message.message_id,
@@ -1605,7 +4083,7 @@ def handle_user_edit_action(call):
         elif action == "edit_quizzes":
             bot.edit_message_text(
                 f"🎯 <b>Edit Quizzes Completed for User {user_id_str}</b>\n\n"
-                f"Current quizzes completed: {participants[user_id_str].get('quizzes_completed', 0)}\n\n"
+                f"Current quizzes completed: {participant.get('quizzes_completed', 0)}\n\n"
                 "Send the new number of quizzes completed:",
                 call.message.chat.id,
                 call.message.message_id,
@@ -1614,20 +4092,16 @@ def handle_user_edit_action(call):
         
         elif action == "toggle_completion":
             # Toggle completion status immediately
-            participants[user_id_str]["has_completed_current_quiz"] = not participants[user_id_str].get("has_completed_current_quiz", False)
-            save_participants(participants)
+            participant["has_completed_current_quiz"] = not participant.get("has_completed_current_quiz", False)
+            save_participant(user_id_str, participant)
             
             # Update quiz completion list
-            completion_data = load_quiz_completion()
-            if participants[user_id_str]["has_completed_current_quiz"]:
-                if user_id_str not in completion_data.get("completed_users", []):
-                    completion_data.setdefault("completed_users", []).append(user_id_str)
+            if participant["has_completed_current_quiz"]:
+                mark_user_completed(user_id_str)
             else:
-                if user_id_str in completion_data.get("completed_users", []):
-                    completion_data["completed_users"].remove(user_id_str)
-            save_quiz_completion(completion_data)
+                unmark_user_completed(user_id_str)
             
-            status = "✅ Completed" if participants[user_id_str]["has_completed_current_quiz"] else "❌ Not Completed"
+            status = "✅ Completed" if participant["has_completed_current_quiz"] else "❌ Not Completed"
             bot.answer_callback_query(call.id, f"✅ Completion status toggled to: {status}")
             # Refresh the user edit view
             handle_edit_user_select(call)
@@ -1635,23 +4109,20 @@ def handle_user_edit_action(call):
         
         elif action == "reset_user":
             # Reset user data
-            participants[user_id_str] = {
-                "name": participants[user_id_str].get("name", f"User_{user_id_str}"),
-                "first_seen": participants[user_id_str].get("first_seen", datetime.now().strftime("%Y-%m-%dT%H:%M:%S")),
-                "chat_ids": participants[user_id_str].get("chat_ids", []),
+            participant = {
+                "name": participant.get("name", f"User_{user_id_str}"),
+                "first_seen": participant.get("first_seen", datetime.now().strftime("%Y-%m-%dT%H:%M:%S")),
+                "chat_ids": participant.get("chat_ids", []),
                 "total_score": 0,
                 "quizzes_completed": 0,
                 "accuracy": 0,
                 "has_completed_current_quiz": False,
                 "last_seen": datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
             }
-            save_participants(participants)
+            save_participant(user_id_str, participant)
             
             # Remove from completion list
-            completion_data = load_quiz_completion()
-            if user_id_str in completion_data.get("completed_users", []):
-                completion_data["completed_users"].remove(user_id_str)
-            save_quiz_completion(completion_data)
+            unmark_user_completed(user_id_str)
             
             bot.answer_callback_query(call.id, "✅ User data reset successfully!")
             # Refresh the user edit view
@@ -2254,11 +4725,7 @@ def handle_debug_device(message):
         debug_text += f"• Last Used: {device_info.get('last_used', 'Unknown')}\n"
         
         # Check if this device is used by other users
-        fingerprints = load_device_fingerprints()
-        device_users = []
-        for uid, data in fingerprints.items():
-            if data.get("fingerprint") == stored_fp and str(uid) != str(user_id):
-                device_users.append(uid)
+        device_users = [uid for uid in get_fingerprint_users(stored_fp) if uid != str(user_id)]
         
         if device_users:
             debug_text += f"\n⚠️ <b>Device Sharing Detected:</b>\n"
@@ -2320,7 +4787,11 @@ def handle_start_quiz(message):
 
     with state.lock:
         if state.is_running:
-            msg = bot.send_message(chat_id, "⚠️ A quiz is already running!")
+            position = quiz_runner_pool.position(chat_id)
+            if position:
+                msg = bot.send_message(chat_id, f"⏳ This chat's quiz is already queued - position {position}.")
+            else:
+                msg = bot.send_message(chat_id, "⚠️ A quiz is already running!")
             schedule_auto_delete(chat_id, msg.message_id)
             return
         
@@ -2330,45 +4801,91 @@ def handle_start_quiz(message):
             schedule_auto_delete(chat_id, msg.message_id)
             return
 
-        # Create an in-memory copy of questions and optionally shuffle using CONFIG flags
-        shuffled_questions = []
-        seed = CONFIG.get("SHUFFLE_SEED", None)
-        rnd = random.Random(seed) if seed is not None else random.Random()
+        # Another bot instance may already be running this chat's quiz
+        run_id = f"{CONFIG['NODE_ID']}:{time.time_ns()}"
+        if not claim_quiz(chat_id, run_id, expected_quiz_duration(len(questions))):
+            msg = bot.send_message(chat_id, "⚠️ A quiz is already running!")
+            schedule_auto_delete(chat_id, msg.message_id)
+            return
 
-        # Determine question order
-        if CONFIG.get("SHUFFLE_QUESTIONS", True):
-            order = list(range(len(questions)))
-            rnd.shuffle(order)
-        else:
-            order = list(range(len(questions)))
+        # From here on a failure must give the claim back, or the chat stays "already running" until it expires
+        setup_error = None
+        try:
+            # Create an in-memory copy of questions and optionally shuffle using CONFIG flags
+            shuffled_questions = []
+            seed = CONFIG.get("SHUFFLE_SEED", None)
+            rnd = random.Random(seed) if seed is not None else random.Random()
+
+            # Determine question order
+            if CONFIG.get("SHUFFLE_QUESTIONS", True):
+                order = list(range(len(questions)))
+                rnd.shuffle(order)
+            else:
+                order = list(range(len(questions)))
 
-        for idx in order:
-            q = questions[idx]
-            opts = q.opts[:]  # copy
+            for idx in order:
+                q = questions[idx]
+                opts = q.opts[:]  # copy
 
-            if CONFIG.get("SHUFFLE_OPTIONS", True):
-                indices = list(range(len(opts)))
-                rnd.shuffle(indices)
-            else:
-                indices = list(range(len(opts)))
+                if CONFIG.get("SHUFFLE_OPTIONS", True):
+                    indices = list(range(len(opts)))
+                    rnd.shuffle(indices)
+                else:
+                    indices = list(range(len(opts)))
 
-            new_opts = [opts[i] for i in indices]
-            try:
-                new_correct = indices.index(q.correct_index)
-            except Exception:
-                new_correct = 0
+                new_opts = [opts[i] for i in indices]
+                try:
+                    new_correct = indices.index(q.correct_index)
+                except Exception:
+                    new_correct = 0
+
+                shuffled_questions.append(Question(q=q.q, opts=new_opts, correct_index=new_correct))
+
+            state.questions = shuffled_questions
+            state.is_running = True
+            state.current_q = -1
+            state.participants.clear()
+            state.first_correct_for_question.clear()
+            state.quiz_start_time_ns = time.time_ns()  # Nanoseconds
+            state.run_id = run_id
+            state.started_by = user_id
+        except Exception as e:
+            setup_error = e
+    if setup_error is not None:
+        abandon_quiz_start(chat_id, state, run_id, setup_error)
+        return
 
-            shuffled_questions.append(Question(q=q.q, opts=new_opts, correct_index=new_correct))
+    # The runner sends the intro itself, so it always comes before question 1
+    try:
+        position = quiz_runner_pool.submit(chat_id, user_id)
+    except Exception as e:
+        abandon_quiz_start(chat_id, state, run_id, e)
+        return
+    if position:
+        msg = bot.send_message(chat_id,
+            f"⏳ <b>Quiz queued</b> - position <b>{position}</b>\n\n"
+            f"Too many quizzes are running right now. "
+            f"This quiz will start automatically when a slot frees up.",
+            parse_mode='HTML'
+        )
+        schedule_auto_delete(chat_id, msg.message_id)
 
-        state.questions = shuffled_questions
-        state.is_running = True
-        state.current_q = -1
-        state.participants.clear()
-        state.first_correct_for_question.clear()
-        state.quiz_start_time_ns = time.time_ns()  # Nanoseconds
+def abandon_quiz_start(chat_id, state, run_id, e):
+    """Undo a /start_quiz whose setup failed after claim_quiz succeeded"""
+    print(f"Error starting quiz in {chat_id}: {e}")
+    with state.lock:
+        if state.run_id == run_id:
+            state.is_running = False
+    release_quiz(chat_id, run_id)
+    try:
+        msg = bot.send_message(chat_id, "❌ Could not start the quiz. Please try again.")
+        schedule_auto_delete(chat_id, msg.message_id)
+    except Exception as send_error:
+        print(f"Error reporting failed quiz start in {chat_id}: {send_error}")
 
-    start_msg = bot.send_message(chat_id, 
-        f"🎯 TMZ BRAND Quiz is starting! {len(questions)} questions coming...\n"
+def quiz_intro_text(question_count):
+    return (
+        f"🎯 TMZ BRAND Quiz is starting! {question_count} questions coming...\n"
         f"⏰ {CONFIG['QUESTION_TIME']} seconds per question\n\n"
         f"⚡ <b>Instant Mode:</b> Questions advance immediately when answered!\n"
         f"🏆 <b>Leaderboard:</b> Final results shown after all questions\n\n"
@@ -2376,84 +4893,262 @@ def handle_start_quiz(message):
         f"• No sharing answers\n"
         f"• One attempt per question\n"
         f"• One attempt per quiz - no repeats!\n"
-        f"• Fastest correct answers get bonus points!",
-        parse_mode='HTML'
+        f"• Fastest correct answers get bonus points!"
     )
-    schedule_auto_delete(chat_id, start_msg.message_id)
-    
-    thread = threading.Thread(target=run_quiz, args=(chat_id, user_id))
-    thread.start()
 
-def run_quiz(chat_id, user_id):
+class QuizRunnerPool:
+    """At most MAX_CONCURRENT_QUIZZES quizzes run at once; later /start_quiz requests wait in FIFO order"""
+    def __init__(self, max_active):
+        self.max_active = max_active
+        self.lock = threading.Lock()
+        self.active = 0
+        self.waiting = deque()
+        self.stats = {"started": 0, "queued": 0, "skipped": 0, "peak_active": 0, "peak_queued": 0}
+
+    def submit(self, chat_id, user_id, announce=True):
+        """Start the chat's quiz, or queue it; returns 0 if started, else the queue position.
+
+        With announce the runner sends the intro message before the first question.
+        """
+        with self.lock:
+            if self.active < self.max_active:
+                self.active += 1
+                self.stats["peak_active"] = max(self.stats["peak_active"], self.active)
+                self._start(chat_id, user_id, announce)
+                return 0
+            self.waiting.append((chat_id, user_id, announce))
+            self.stats["queued"] += 1
+            self.stats["peak_queued"] = max(self.stats["peak_queued"], len(self.waiting))
+            return len(self.waiting)
+
+    def position(self, chat_id):
+        with self.lock:
+            for position, (waiting_chat_id, _, _) in enumerate(self.waiting, 1):
+                if waiting_chat_id == chat_id:
+                    return position
+        return 0
+
+    def counts(self):
+        with self.lock:
+            return self.active, len(self.waiting)
+
+    def _start(self, chat_id, user_id, announce):
+        self.stats["started"] += 1
+        if async_engine.running:
+            future = async_engine.submit(async_engine.run_quiz(chat_id, user_id, announce))
+            future.add_done_callback(lambda f: self._finished())
+        else:
+            threading.Thread(target=self._run, args=(chat_id, user_id, announce)).start()
+
+    def _run(self, chat_id, user_id, announce):
+        try:
+            run_quiz(chat_id, user_id, announce)
+        finally:
+            self._finished()
+
+    def _finished(self):
+        """A slot freed up: start the next queued quiz that is still wanted"""
+        with self.lock:
+            while self.waiting:
+                chat_id, user_id, announce = self.waiting.popleft()
+                state = chat_state.get(chat_id)
+                if state is None or not state.is_running:
+                    # Cleared by an admin while waiting
+                    self.stats["skipped"] += 1
+                    continue
+                self._start(chat_id, user_id, announce)
+                return
+            self.active -= 1
+
+quiz_runner_pool = QuizRunnerPool(CONFIG["MAX_CONCURRENT_QUIZZES"])
+
+def begin_question(state, q_idx):
+    """Reset per-question state; returns False once the quiz has been stopped"""
+    # Close the previous question to new answers; the ones already accepted still count for it
+    state.question_deadline = time.monotonic()
+    score_pending_answers(state)
+    with state.lock:
+        if not state.is_running:
+            return False
+        
+        with state.answer_lock:
+            state.question_deadline = None
+            state.current_q = q_idx
+            state.question_answered = False
+            state.question_answered_at = None
+            state.answered_users_per_question.clear()
+            state.first_correct_for_question[q_idx] = None
+            # A question resumed from a checkpoint keeps the answers already given to it
+            for uid, pdata in state.participants.items():
+                answer = pdata["answers"].get(q_idx)
+                if answer is not None:
+                    state.answered_users_per_question.add(uid)
+                    state.answer_claims[(q_idx, uid)] = True
+                    first = state.first_correct_for_question[q_idx]
+                    if answer["correct"] and (first is None or answer["time_ns"] < state.participants[first]["answers"][q_idx]["time_ns"]):
+                        state.first_correct_for_question[q_idx] = uid
+            state.question_sent_ns = None
+            state.question_timing = None
+            state.question_start_ns = time.monotonic_ns()
+            state.question_start_wall_ns = time.time_ns()
+    quiz_checkpointer.mark_quiz(state.chat_id)
+    # Other instances forward answers for the live question to us
+    update_quiz_record(state.chat_id, state.run_id, current_q=q_idx,
+                       expires_at=time.time() + expected_quiz_duration(len(state.questions) - q_idx))
+    return True
+
+def format_question(questions, q_idx):
+    return f"❓ <b>Question {q_idx+1}/{len(questions)}</b>\n\n{questions[q_idx].q}"
+
+def finish_quiz(chat_id, state, total_questions):
+    """Commit results and show the final leaderboard"""
+    score_pending_answers(state)
+    with state.lock:
+        state.is_running = False
+        # Only participants who answered at least one question count as completed
+        results = {uid: dict(pdata) for uid, pdata in state.participants.items() if pdata['answers']}
+
+    # Commit all stats and completions in one batch, outside the chat lock
+    commit_quiz_results(results, total_questions)
+    state.results_committed = True
+
+    # Show final leaderboard
+    leaderboard_manager.show_final_leaderboard(chat_id, state.participants, total_questions, state.ranking)
+
+def report_quiz_error(chat_id, e):
+    print(f"Error in quiz: {e}")
+    msg = bot.send_message(chat_id, "❌ An error occurred during the quiz. Please try again.")
+    schedule_auto_delete(chat_id, msg.message_id)
+
+def end_quiz(chat_id, state):
+    # Always clear state whether quiz completes or errors
+    live_scoreboard.close(chat_id)
+    try:
+        for q_idx in range(len(state.questions)):
+            state_backend.delete(answered_key(chat_id, state.run_id, q_idx))
+        state_backend.delete(inbox_key(chat_id, state.run_id))
+    except Exception as e:
+        print(f"Error cleaning up quiz keys for {chat_id}: {e}")
+    clear_state(chat_id)
+    # After clear_state, so a concurrent checkpoint flush can no longer find this run.
+    # Uncommitted results keep their checkpoint so the next start can finalize them.
+    if state.results_committed:
+        quiz_checkpointer.discard(chat_id, state.run_id)
+    elif state.run_id is not None:
+        print(f"⚠️ Keeping quiz checkpoint for chat {chat_id}: results were not committed")
+
+def run_quiz(chat_id, user_id, announce=False):
+    state = get_state(chat_id)
     try:
-        state = get_state(chat_id)
         questions = state.questions
 
-        for q_idx in range(len(questions)):
-            with state.lock:
-                if not state.is_running:
-                    break
-                
-                state.current_q = q_idx
-                state.question_answered = False
-                state.answered_users_per_question.clear()
-                state.first_correct_for_question[q_idx] = None
-                state.question_start_time_ns = time.time_ns()  # Nanoseconds
+        if announce:
+            # Sent by the runner so it always precedes question 1 (and queued quizzes get it when they start)
+            start_msg = bot.send_message(chat_id, quiz_intro_text(len(questions)), parse_mode='HTML', critical=True)
+            schedule_auto_delete(chat_id, start_msg.message_id)
+
+        for q_idx in range(state.resume_q, len(questions)):
+            if not begin_question(state, q_idx):
+                break
 
             # Send question
-            question_text = f"❓ <b>Question {q_idx+1}/{len(questions)}</b>\n\n{questions[q_idx].q}"
-            sent_msg = bot.send_message(chat_id, question_text, 
+            sent_msg = bot.send_message(chat_id, format_question(questions, q_idx), 
                                       reply_markup=make_keyboard(q_idx, questions),
-                                      parse_mode='HTML')
+                                      parse_mode='HTML', critical=True)
+            response_timer.question_sent(state)
             
             with state.lock:
                 state.question_message_id = sent_msg.message_id
+            quiz_checkpointer.mark_quiz(chat_id)
 
             # Start countdown
             start_countdown(chat_id, CONFIG["QUESTION_TIME"])
 
-            # Wait for time or all answers
-            question_start = time.time()
-            while time.time() - question_start < CONFIG["QUESTION_TIME"]:
-                with state.lock:
-                    if state.question_answered:
-                        break
-                time.sleep(0.1)
+            # Score answers until time is up or everyone has answered
+            if wait_question_done(state, CONFIG["QUESTION_TIME"]):
+                record_advance_latency(time.monotonic() - state.question_answered_at)
 
-            # Stop countdown
-            stop_countdown(chat_id)
-
-            # Delete the question message immediately
-            try:
-                bot.delete_message(chat_id, state.question_message_id)
-            except Exception:
-                pass
+            # Stop countdown, then delete the question and countdown messages in one call
+            countdown_message_id = stop_countdown(chat_id, delete=False)
+            delete_messages_bulk(chat_id, [state.question_message_id, countdown_message_id])
 
             # Wait before next question
             time.sleep(CONFIG["QUESTION_TRANSITION_DELAY"])
 
         # Quiz completed
-        with state.lock:
-            state.is_running = False
-            
-            # Update participant stats
-            for uid, pdata in state.participants.items():
-                if pdata['answers']:  # Only update if they answered at least one question
-                    update_participant_stats(uid, pdata['score'], pdata['correct_answers'], len(questions))
-                    mark_user_completed(uid)  # Mark as completed
-
-            # Show final leaderboard
-            final_leaderboard = leaderboard_manager.show_final_leaderboard(
-                chat_id, state.participants, len(questions)
-            )
+        finish_quiz(chat_id, state, len(questions))
             
     except Exception as e:
-        print(f"Error in quiz: {e}")
-        msg = bot.send_message(chat_id, "❌ An error occurred during the quiz. Please try again.")
-        schedule_auto_delete(chat_id, msg.message_id)
+        report_quiz_error(chat_id, e)
     finally:
-        # Always clear state whether quiz completes or errors
-        clear_state(chat_id)
+        end_quiz(chat_id, state)
+
+def score_answer(state, user_id, participant_name, q_idx, ans_idx, response_time_ns):
+    """Record an accepted answer and queue its feedback; quiz runner only, holding state.answer_lock. Returns whether it was correct."""
+    chat_id = state.chat_id
+    state.answered_users_per_question.add(user_id)
+    quiz_checkpointer.mark_participant(chat_id, user_id)
+    
+    if user_id not in state.participants:
+        state.participants[user_id] = {
+            "score": 0,
+            "answers": {},
+            "total_time_ns": 0,
+            "name": participant_name,
+            "correct_answers": 0
+        }
+
+    state.participants[user_id]["total_time_ns"] += response_time_ns
+
+    # Check answer
+    is_correct = (ans_idx == state.questions[q_idx].correct_index)
+    state.participants[user_id]["answers"][q_idx] = {
+        "answer_index": ans_idx,
+        "correct": is_correct,
+        "time_ns": response_time_ns
+    }
+
+    points_earned = 0
+    if is_correct:
+        points_earned = CONFIG["POINTS_CORRECT"]
+        state.participants[user_id]["correct_answers"] += 1
+        
+        # First correct bonus
+        if state.first_correct_for_question[q_idx] is None:
+            state.first_correct_for_question[q_idx] = user_id
+            points_earned += CONFIG["POINTS_FIRST_CORRECT_BONUS"]
+            bonus_text = " + 🚀 First Correct Bonus!"
+        else:
+            bonus_text = ""
+        
+        state.participants[user_id]["score"] += points_earned
+        
+        # Convert nanoseconds to seconds for display
+        response_time_seconds = response_time_ns / 1_000_000_000
+        
+        # Send immediate feedback
+        feedback = (
+            f"✅ <b>CORRECT!</b> {participant_name}\n"
+            f"🏆 Points: +{points_earned}{bonus_text}\n"
+            f"⏱ Time: {response_time_seconds:.2f}s"
+        )
+    else:
+        feedback = f"❌ <b>WRONG!</b> {participant_name}"
+
+    pdata = state.participants[user_id]
+    state.ranking.update(user_id, pdata["score"], pdata["total_time_ns"])
+    if is_correct:
+        feedback += f"\n📈 Rank: #{state.ranking.rank(user_id)}/{len(state.ranking)}"
+
+    # Queue feedback message (sent by the outbound workers, not under the lock)
+    outbound_queue.enqueue(chat_id, feedback, parse_mode='HTML')
+
+    # Show live points update
+    if CONFIG["LIVE_SCOREBOARD_MODE"] == "edit":
+        live_scoreboard.mark_dirty(chat_id)
+    else:
+        outbound_queue.enqueue(chat_id, render_live_points(state), parse_mode='HTML', key="live_points")
+    return is_correct
 
 @bot.callback_query_handler(func=lambda call: call.data and call.data.startswith("ans|"))
 def handle_answer(call):
@@ -2470,101 +5165,46 @@ def handle_answer(call):
             bot.answer_callback_query(call.id, "❌ You already completed this quiz!", show_alert=True)
             return
         
-        state = get_state(chat_id)
-        
-        with state.answer_lock:
-            if not state.is_running or state.question_answered:
-                bot.answer_callback_query(call.id, "❌ Too late! Question time expired.")
-                return
-
-            # Parse callback data
-            parts = call.data.split("|")
-            q_idx = int(parts[1])
-            ans_idx = int(parts[2])
-
-            if q_idx != state.current_q:
-                bot.answer_callback_query(call.id, "❌ Invalid question!")
-                return
-
-            if user_id in state.answered_users_per_question:
-                bot.answer_callback_query(call.id, "❌ You already answered this question!")
-                return
-
-            # Record answer
-            state.answered_users_per_question.add(user_id)
-            participant_name = get_participant_name(user_id)
-            
-            if user_id not in state.participants:
-                state.participants[user_id] = {
-                    "score": 0,
-                    "answers": {},
-                    "total_time_ns": 0,
-                    "name": participant_name,
-                    "correct_answers": 0
-                }
+        # Parse callback data
+        parts = call.data.split("|")
+        q_idx = int(parts[1])
+        ans_idx = int(parts[2])
+
+        state = chat_state.get(chat_id)
+        if (state is None or not state.is_running) and state_backend.shared:
+            # The quiz may be running on another bot instance
+            bot.answer_callback_query(call.id, forward_answer(chat_id, user_id, q_idx, ans_idx))
+            return
+        if state is None:
+            state = get_state(chat_id)
+
+        # Stamp the answer on arrival; the quiz runner scores it
+        received_ns = time.monotonic_ns()
+        participant_name = get_participant_name(user_id)
+        deadline = state.question_deadline
+        if (not state.is_running or state.question_answered
+                or (deadline is not None and time.monotonic() > deadline)):
+            bot.answer_callback_query(call.id, "❌ Too late! Question time expired.")
+            return
 
-            # Calculate response time (nanoseconds)
-            response_time_ns = time.time_ns() - state.question_start_time_ns
-            state.participants[user_id]["total_time_ns"] += response_time_ns
+        if q_idx != state.current_q:
+            bot.answer_callback_query(call.id, "❌ Invalid question!")
+            return
 
-            # Check answer
-            is_correct = (ans_idx == state.questions[q_idx].correct_index)
-            state.participants[user_id]["answers"][q_idx] = {
-                "answer_index": ans_idx,
-                "correct": is_correct,
-                "time_ns": response_time_ns
-            }
+        if (not state.claim_answer(q_idx, user_id)
+                or (state_backend.shared and not state_backend.set_add(answered_key(chat_id, state.run_id, q_idx), str(user_id)))):
+            bot.answer_callback_query(call.id, "❌ You already answered this question!")
+            return
 
-            points_earned = 0
-            if is_correct:
-                points_earned = CONFIG["POINTS_CORRECT"]
-                state.participants[user_id]["correct_answers"] += 1
-                
-                # First correct bonus
-                if state.first_correct_for_question[q_idx] is None:
-                    state.first_correct_for_question[q_idx] = user_id
-                    points_earned += CONFIG["POINTS_FIRST_CORRECT_BONUS"]
-                    bonus_text = " + 🚀 First Correct Bonus!"
-                else:
-                    bonus_text = ""
-                
-                state.participants[user_id]["score"] += points_earned
-                
-                # Convert nanoseconds to seconds for display
-                response_time_seconds = response_time_ns / 1_000_000_000
-                
-                # Send immediate feedback
-                feedback = (
-                    f"✅ <b>CORRECT!</b> {participant_name}\n"
-                    f"🏆 Points: +{points_earned}{bonus_text}\n"
-                    f"⏱ Time: {response_time_seconds:.2f}s"
-                )
-                
-                bot.answer_callback_query(call.id, f"✅ Correct! +{points_earned} points")
-                
-                # Check if this should advance the question
-                if len(state.answered_users_per_question) >= len(state.participants):
-                    state.question_answered = True
-                    stop_countdown(chat_id)
-            else:
-                correct_letter = chr(65 + state.questions[q_idx].correct_index)
-                bot.answer_callback_query(call.id, f"❌ Wrong! Correct answer was ")
-                feedback = f"❌ <b>WRONG!</b> {participant_name}"
-
-            # Send feedback message
-            feedback_msg = bot.send_message(chat_id, feedback, parse_mode='HTML')
-            schedule_auto_delete(chat_id, feedback_msg.message_id)
-
-            # Show live points update
-            leaderboard = "🏅 <b>Live Points</b>\n"
-            sorted_participants = sorted(
-                state.participants.items(),
-                key=lambda x: -x[1]['score']
-            )
-            for i, (uid, pdata) in enumerate(sorted_participants, 1):
-                leaderboard += f"{i}. {pdata['name']}: <b>{pdata['score']}</b> pts\n"
-            leaderboard_msg = bot.send_message(chat_id, leaderboard, parse_mode='HTML')
-            schedule_auto_delete(chat_id, leaderboard_msg.message_id)
+        state.queue_answer({
+            "user_id": user_id,
+            "name": participant_name,
+            "q_idx": q_idx,
+            "ans_idx": ans_idx,
+            "received_ns": received_ns,
+        })
+        # The runner may still count it as late, so don't promise a result here
+        bot.answer_callback_query(call.id, "📨 Answer received!")
             
     except Exception as e:
         print(f"Error handling answer: {e}")
@@ -2846,16 +5486,10 @@ def handle_confirmation(call):
     try:
         if call.data == "confirm_reset":
             # Reset quiz completion data
-            completion_data = load_quiz_completion()
-            completion_data["completed_users"] = []
-            completion_data["quiz_active"] = True
-            save_quiz_completion(completion_data)
+            completion_registry.reset(quiz_active=True)
             
             # Reset participant completion flags
-            participants = load_participants()
-            for user_data in participants.values():
-                user_data["has_completed_current_quiz"] = False
-            save_participants(participants)
+            participant_cache.update_each(lambda uid, data: data.update(has_completed_current_quiz=False))
             
             bot.edit_message_text(
                 "✅ <b>Quiz reset successfully!</b>\n\nAll users can now take the quiz again.",
@@ -2973,12 +5607,7 @@ def handle_reset_user_device(message, admin_state):
             clear_admin_state(message.from_user.id)
             return
         
-        fingerprints = load_device_fingerprints()
-        
-        if target_user_id in fingerprints:
-            del fingerprints[target_user_id]
-            save_device_fingerprints(fingerprints)
-            
+        if delete_device_record(target_user_id):
             msg = bot.send_message(
                 message.chat.id,
                 f"✅ <b>Device reset successful!</b>\n\n"
@@ -3013,8 +5642,8 @@ def handle_edit_user_flow(message, admin_state):
         except:
             pass
         
-        participants = load_participants()
-        if user_id_str not in participants:
+        participant = get_participant(user_id_str)
+        if participant is None:
             msg = bot.send_message(message.chat.id, "❌ User not found!")
             schedule_auto_delete(message.chat.id, msg.message_id)
             clear_admin_state(message.from_user.id)
@@ -3022,8 +5651,8 @@ def handle_edit_user_flow(message, admin_state):
         
         if action == "edit_name":
             new_name = message.text.strip()
-            participants[user_id_str]["name"] = new_name
-            save_participants(participants)
+            participant["name"] = new_name
+            save_participant(user_id_str, participant)
             
             msg = bot.send_message(
                 message.chat.id,
@@ -3035,8 +5664,8 @@ def handle_edit_user_flow(message, admin_state):
         elif action == "edit_score":
             try:
                 new_score = int(message.text)
-                participants[user_id_str]["total_score"] = new_score
-                save_participants(participants)
+                participant["total_score"] = new_score
+                save_participant(user_id_str, participant)
                 
                 msg = bot.send_message(
                     message.chat.id,
@@ -3051,8 +5680,8 @@ def handle_edit_user_flow(message, admin_state):
             try:
                 new_accuracy = float(message.text)
                 if 0 <= new_accuracy <= 100:
-                    participants[user_id_str]["accuracy"] = new_accuracy
-                    save_participants(participants)
+                    participant["accuracy"] = new_accuracy
+                    save_participant(user_id_str, participant)
                     
                     msg = bot.send_message(
                         message.chat.id,
@@ -3068,8 +5697,8 @@ def handle_edit_user_flow(message, admin_state):
         elif action == "edit_quizzes":
             try:
                 new_quizzes = int(message.text)
-                participants[user_id_str]["quizzes_completed"] = new_quizzes
-                save_participants(participants)
+                participant["quizzes_completed"] = new_quizzes
+                save_participant(user_id_str, participant)
                 
                 msg = bot.send_message(
                     message.chat.id,
@@ -3322,8 +5951,452 @@ def handle_add_correct(call):
         print(f"Error adding correct answer: {e}")
         bot.answer_callback_query(call.id, "❌ Error adding question")
 
+# === ASYNCIO ENGINE ===
+class SessionResponse:
+    """The parts of requests.Response that telebot.apihelper reads"""
+    def __init__(self, status_code, reason, text):
+        self.status_code = status_code
+        self.reason = reason
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+class AsyncEngine:
+    """Optional runtime (ENGINE=asyncio) built on AsyncTeleBot and one event loop.
+
+    Quizzes, their countdowns and due auto-deletes run as tasks on the loop
+    instead of one thread each. Handlers stay the synchronous functions
+    registered on `bot` and run in a fixed pool; their Bot API calls are
+    routed onto the loop so every request shares one aiohttp session.
+    """
+    def __init__(self):
+        self.loop = None
+        self.async_bot = None
+        self.thread = None
+        self.handler_pool = None
+        self.stats = {"quizzes": 0, "countdown_edits": 0, "countdown_failed": 0}
+
+    @property
+    def running(self):
+        return self.loop is not None
+
+    def start(self):
+        try:
+            from telebot.async_telebot import AsyncTeleBot
+        except ImportError as e:
+            print(f"ERROR: ENGINE=asyncio needs aiohttp installed ({e})")
+            raise SystemExit(1)
+        self.loop = asyncio.new_event_loop()
+        self.async_bot = AsyncTeleBot(TOKEN)
+        self.handler_pool = ThreadPoolExecutor(max_workers=CONFIG["ASYNC_HANDLER_WORKERS"], thread_name_prefix="handler")
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        # Synchronous bot calls (handlers, leaderboards, outbound queue) go through the loop's session
+        telebot.apihelper.CUSTOM_REQUEST_SENDER = self._send_request
+        # Handlers already run in handler_pool; don't queue them again in TeleBot's worker pool
+        bot.threaded = False
+        auto_delete_scheduler.dispatch = self._dispatch_delete
+        print("⚙️ Asyncio engine started")
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def _send_request(self, method, url, params=None, files=None, timeout=None, proxies=None):
+        if threading.current_thread() is self.thread:
+            raise RuntimeError("synchronous Bot API call made on the event loop thread")
+        total = sum(timeout) if isinstance(timeout, tuple) else timeout
+        return self.submit(self._request(method, url, params, files, total)).result()
+
+    async def _request(self, method, url, params, files, timeout):
+        from telebot import asyncio_helper
+        import aiohttp
+        session = await asyncio_helper.session_manager.get_session()
+        data = asyncio_helper._prepare_data(params, files)
+        async with session.request(method, url, data=data, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            return SessionResponse(resp.status, resp.reason, await resp.text())
+
+    # --- update intake
+    def start_polling(self):
+        self.submit(self._poll_updates())
+
+    async def _poll_updates(self):
+        offset = None
+        while True:
+            try:
+                updates = await self.async_bot.get_updates(offset=offset, timeout=CONFIG["ASYNC_POLL_TIMEOUT"])
+            except Exception as e:
+                print(f"Error polling updates: {e}")
+                await asyncio.sleep(3)
+                continue
+            for update in updates:
+                offset = update.update_id + 1
+                self.loop.run_in_executor(self.handler_pool, self._handle_update, update)
+
+    def _handle_update(self, update):
+        try:
+            bot.process_new_updates([update])
+        except Exception as e:
+            print(f"Error processing update {update.update_id}: {e}")
+
+    # --- outbound calls made from tasks
+    async def send_message(self, chat_id, text, cosmetic=False, critical=False, **kwargs):
+        return await outbound_limiter.call_async(chat_id, self.async_bot.send_message, chat_id, text,
+                                                 cosmetic=cosmetic, critical=critical, **kwargs)
+
+    async def delete_messages(self, chat_id, message_ids):
+        """delete_messages_bulk() for tasks"""
+        from telebot import asyncio_helper
+        steps = delete_steps(chat_id, message_ids)
+        error = None
+        while True:
+            try:
+                kind, target = steps.send(error)
+            except StopIteration:
+                return
+            try:
+                if kind == "batch":
+                    await outbound_limiter.call_async(
+                        None, asyncio_helper._process_request, TOKEN, 'deleteMessages',
+                        params={'chat_id': chat_id, 'message_ids': json.dumps(target)}, method='post'
+                    )
+                else:
+                    await outbound_limiter.call_async(None, self.async_bot.delete_message, chat_id, target)
+                error = None
+            except Exception as e:
+                error = e
+
+    def _dispatch_delete(self, chat_id, message_ids):
+        self.submit(self._auto_delete(chat_id, message_ids))
+
+    async def _auto_delete(self, chat_id, message_ids):
+        try:
+            await self.delete_messages(chat_id, message_ids)
+        finally:
+            auto_delete_scheduler.finish(chat_id, message_ids)
+
+    # --- quiz tasks
+    async def countdown(self, chat_id, duration, stop, countdown):
+        """CountdownTicker behaviour as a task: edit at COUNTDOWN_MARKS until stop is set"""
+        try:
+            msg = await self.send_message(chat_id, countdown_text(duration), parse_mode='Markdown', cosmetic=True)
+        except Exception as e:
+            print(f"Error sending countdown to {chat_id}: {e}")
+            return
+        if msg is None:
+            return
+        countdown["message_id"] = msg.message_id
+        schedule_auto_delete(chat_id, msg.message_id, duration)
+        deadline = self.loop.time() + duration
+        for mark in sorted(set(CONFIG["COUNTDOWN_MARKS"]), reverse=True):
+            if not 0 <= mark < duration:
+                continue
+            try:
+                await asyncio.wait_for(stop.wait(), max(0, deadline - mark - self.loop.time()))
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                edited = await outbound_limiter.call_async(
+                    chat_id, self.async_bot.edit_message_text, countdown_text(mark),
+                    chat_id=chat_id, message_id=msg.message_id, parse_mode='Markdown', cosmetic=True
+                )
+                if edited is not None:
+                    self.stats["countdown_edits"] += 1
+            except Exception as e:
+                self.stats["countdown_failed"] += 1
+                print(f"Error updating countdown for {chat_id}: {e}")
+
+    async def run_quiz(self, chat_id, user_id, announce=False):
+        """run_quiz() as a task"""
+        self.stats["quizzes"] += 1
+        state = get_state(chat_id)
+        ready = asyncio.Event()
+        state.on_answer_queued = lambda: self.loop.call_soon_threadsafe(ready.set)
+        try:
+            questions = state.questions
+
+            if announce:
+                start_msg = await self.send_message(chat_id, quiz_intro_text(len(questions)), parse_mode='HTML',
+                                                    critical=True)
+                schedule_auto_delete(chat_id, start_msg.message_id)
+
+            for q_idx in range(state.resume_q, len(questions)):
+                # State backend and SQLite calls stay off the event loop
+                if not await self.loop.run_in_executor(self.handler_pool, begin_question, state, q_idx):
+                    break
+
+                sent_msg = await self.send_message(chat_id, format_question(questions, q_idx),
+                                                   reply_markup=make_keyboard(q_idx, questions),
+                                                   parse_mode='HTML', critical=True)
+                response_timer.question_sent(state)
+                with state.lock:
+                    state.question_message_id = sent_msg.message_id
+                quiz_checkpointer.mark_quiz(chat_id)
+
+                stop, countdown = asyncio.Event(), {"message_id": None}
+                countdown_task = self.loop.create_task(
+                    self.countdown(chat_id, CONFIG["QUESTION_TIME"], stop, countdown)
+                )
+
+                # Score answers until time is up or everyone has answered
+                deadline = time.monotonic() + CONFIG["QUESTION_TIME"]
+                state.question_deadline = deadline
+                while True:
+                    ready.clear()
+                    if state_backend.shared:
+                        # Draining the forwarded answers is a network call
+                        await self.loop.run_in_executor(self.handler_pool, score_pending_answers, state)
+                    else:
+                        score_pending_answers(state)
+                    remaining = deadline - time.monotonic()
+                    if state.question_answered or remaining <= 0:
+                        break
+                    if state_backend.shared:
+                        remaining = min(remaining, CONFIG["STATE_INBOX_POLL"])
+                    try:
+                        await asyncio.wait_for(ready.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                if state.question_answered:
+                    record_advance_latency(time.monotonic() - state.question_answered_at)
+
+                stop.set()
+                await countdown_task
+                await self.delete_messages(chat_id, [state.question_message_id, countdown["message_id"]])
+
+                await asyncio.sleep(CONFIG["QUESTION_TRANSITION_DELAY"])
+
+            # SQLite writes and the leaderboard use the synchronous helpers
+            await self.loop.run_in_executor(self.handler_pool, finish_quiz, chat_id, state, len(questions))
+
+        except Exception as e:
+            await self.loop.run_in_executor(self.handler_pool, report_quiz_error, chat_id, e)
+        finally:
+            state.on_answer_queued = None
+            await self.loop.run_in_executor(self.handler_pool, end_quiz, chat_id, state)
+
+async_engine = AsyncEngine()
+
+# === WEBHOOK INGESTION ===
+class UpdateDispatcher:
+    """Hands updates to a bounded handler pool (webhook requests return 200 right away)"""
+    def __init__(self, workers, max_pending):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="updates")
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.stats = {"received": 0, "rejected": 0, "failed": 0}
+
+    def submit(self, update):
+        """Queue one update; False when the pool is saturated"""
+        if not self.slots.acquire(blocking=False):
+            self.stats["rejected"] += 1
+            return False
+        self.stats["received"] += 1
+        self.executor.submit(self._process, update)
+        return True
+
+    def _process(self, update):
+        try:
+            bot.process_new_updates([update])
+        except Exception as e:
+            self.stats["failed"] += 1
+            print(f"Error processing update {update.update_id}: {e}")
+        finally:
+            self.slots.release()
+
+update_dispatcher = UpdateDispatcher(CONFIG["WEBHOOK_WORKERS"], CONFIG["WEBHOOK_MAX_PENDING"])
+
+def get_webhook_secret():
+    # Telegram allows A-Z, a-z, 0-9, _ and - in secret tokens
+    return CONFIG["WEBHOOK_SECRET"] or hashlib.sha256(TOKEN.encode()).hexdigest()[:32]
+
+@app.route("/webhook/<secret>", methods=["POST"])
+def telegram_webhook(secret):
+    expected = get_webhook_secret()
+    if secret != expected or request.headers.get("X-Telegram-Bot-Api-Secret-Token") != expected:
+        abort(403)
+    if shard_router.running:
+        shard_router.route(request.get_json(force=True, silent=True) or {})
+        return "", 200
+    update = types.Update.de_json(request.get_data(as_text=True))
+    if update is None:
+        return "", 200
+    if not update_dispatcher.submit(update):
+        # Telegram redelivers on non-2xx, so a saturated pool sheds load instead of dropping updates
+        return "", 503
+    return "", 200
+
+def setup_webhook():
+    """Register the webhook with Telegram and run handlers inline in the webhook pool"""
+    if not CONFIG["WEBHOOK_URL"]:
+        print("ERROR: UPDATE_MODE is webhook but WEBHOOK_URL is not set")
+        raise SystemExit(1)
+    secret = get_webhook_secret()
+    # The webhook pool already bounds concurrency; don't hand handlers to TeleBot's own worker queue
+    bot.threaded = False
+    bot.remove_webhook()
+    bot.set_webhook(url=f"{CONFIG['WEBHOOK_URL'].rstrip('/')}/webhook/{secret}", secret_token=secret,
+                    max_connections=CONFIG["WEBHOOK_WORKERS"])
+    print(f"🔗 Webhook registered at {CONFIG['WEBHOOK_URL'].rstrip('/')}/webhook/<secret>")
+
+# === MULTI-PROCESS SHARDING ===
+def shard_for(chat_id, count):
+    return chat_id % count
+
+def owns_chat(chat_id):
+    """True unless this is a shard worker and the chat belongs to another shard"""
+    index = CONFIG.get("SHARD_INDEX")
+    return index is None or shard_for(chat_id, CONFIG["SHARD_WORKERS"]) == index
+
+def update_chat_id(update):
+    """Chat an update (raw JSON dict) belongs to; user-only updates fall back to the user's private chat"""
+    for key in ("message", "edited_message", "channel_post", "edited_channel_post",
+                "my_chat_member", "chat_member", "chat_join_request"):
+        if key in update:
+            return update[key]["chat"]["id"]
+    if "callback_query" in update:
+        callback = update["callback_query"]
+        message = callback.get("message")
+        return message["chat"]["id"] if message else callback["from"]["id"]
+    for key, value in update.items():
+        if isinstance(value, dict):
+            user = value.get("from") or value.get("user")
+            if user:
+                return user["id"]
+    return 0
+
+def enable_shared_store():
+    """Make caches safe when several processes share the SQLite store and completion log"""
+    participant_cache.shared = True
+    device_registry.shared = True
+    completion_registry.shared = True
+
+def start_runtime():
+    """Start the background machinery of a process that handles updates"""
+    if CONFIG["ENGINE"] == "asyncio":
+        async_engine.start()
+    participant_cache.start_flusher()
+    device_registry.start_flusher()
+    restored = auto_delete_scheduler.restore()
+    if restored:
+        print(f"🗑️ Restored {restored} pending auto-deletions")
+    recovered = recover_interrupted_quizzes()
+    if recovered:
+        print(f"♻️ Recovered {recovered} interrupted quizzes")
+
+    # Start periodic cleanup thread
+    def periodic_cleanup():
+        while True:
+            time.sleep(3600)  # Run every hour
+            cleanup_old_admin_states()
+            outbound_limiter.prune_idle()
+            print("🕒 Periodic cleanup completed")
+    
+    cleanup_thread = threading.Thread(target=periodic_cleanup, daemon=True)
+    cleanup_thread.start()
+
+def flush_write_behind():
+    """Persist everything the atexit hooks would (forked workers leave through os._exit, skipping them)"""
+    for shutdown in (participant_cache.shutdown, device_registry.shutdown,
+                     auto_delete_scheduler.persist, quiz_checkpointer.shutdown):
+        try:
+            shutdown()
+        except Exception as e:
+            print(f"Error flushing on shutdown: {e}")
+
+def run_shard_worker(index, count, updates):
+    """Worker process: owns the chats with shard_for(chat_id) == index and runs their handlers"""
+    # The forked main thread inherited the parent's pooled HTTPS session; never share its connections
+    telebot.apihelper._get_req_session(reset=True)
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    CONFIG["SHARD_INDEX"] = index
+    try:
+        enable_shared_store()
+        # Telegram's global limit is per bot, so each worker gets its share of it
+        per_worker = CONFIG["RATE_LIMIT_GLOBAL_PER_SEC"] / count
+        outbound_limiter.global_bucket = TokenBucket(per_worker, max(1, per_worker))
+        start_runtime()
+        bot.threaded = False
+        print(f"🧩 Shard worker {index + 1}/{count} started (pid {os.getpid()})")
+        while not stop.is_set():
+            try:
+                update = types.Update.de_json(updates.get(timeout=0.5))
+            except queue.Empty:
+                continue
+            if update is None:
+                continue
+            while not update_dispatcher.submit(update) and not stop.is_set():
+                time.sleep(0.05)
+    finally:
+        flush_write_behind()
+        print(f"🧩 Shard worker {index + 1}/{count} stopped")
+
+class ShardRouter:
+    """Front process: fetches updates and routes each to the worker process that owns its chat"""
+    def __init__(self, count):
+        self.count = count
+        self.queues = []
+        self.processes = []
+        self.stats = {"routed": [0] * count, "restarts": 0}
+
+    @property
+    def running(self):
+        return bool(self.processes)
+
+    def start(self):
+        import multiprocessing
+        # Workers are forked from the fully imported module; nothing may hold the DB open across the fork
+        close_db()
+        context = multiprocessing.get_context("fork")
+        self.queues = [context.Queue() for _ in range(self.count)]
+        self.processes = [self._spawn(context, index) for index in range(self.count)]
+        threading.Thread(target=self._supervise, args=(context,), daemon=True).start()
+        print(f"🧩 Started {self.count} shard workers")
+
+    def _spawn(self, context, index):
+        process = context.Process(target=run_shard_worker, args=(index, self.count, self.queues[index]),
+                                  name=f"quiz-shard-{index}", daemon=True)
+        process.start()
+        return process
+
+    def _supervise(self, context):
+        while True:
+            time.sleep(5)
+            for index, process in enumerate(self.processes):
+                if not process.is_alive():
+                    print(f"⚠️ Shard worker {index} exited ({process.exitcode}), restarting")
+                    self.processes[index] = self._spawn(context, index)
+                    self.stats["restarts"] += 1
+
+    def route(self, update):
+        index = shard_for(update_chat_id(update), self.count)
+        self.stats["routed"][index] += 1
+        self.queues[index].put(update)
+
+    def poll(self):
+        """Long-poll getUpdates and route the raw updates"""
+        offset = None
+        while True:
+            try:
+                updates = telebot.apihelper.get_updates(TOKEN, offset=offset, timeout=20, long_polling_timeout=20)
+            except Exception as e:
+                print(f"Error polling updates: {e}")
+                time.sleep(3)
+                continue
+            for update in updates:
+                offset = update["update_id"] + 1
+                self.route(update)
+
+shard_router = ShardRouter(max(1, CONFIG["SHARD_WORKERS"]))
+
 # === MAIN ===
 if __name__ == "__main__":
+    if "--state-server" in sys.argv:
+        # Shared state server for running several bot instances (STATE_BACKEND=network)
+        run_state_server(CONFIG["STATE_SERVER_ADDRESS"])
+        sys.exit(0)
+    
     print("🤖 TMZ BRAND Quiz Bot Started!")
     print("📊 Features: One-time quiz, Admin panel, Edit questions, Leaderboard")
     print("⚡ Instant mode: Questions advance when all participants answer")
@@ -3334,6 +6407,12 @@ if __name__ == "__main__":
     print("🔧 Enhanced state management with comprehensive clearing")
     print("👤 User Editing: Full user data management in admin panel")
     
+    # Open the SQLite store (imports legacy JSON data on first start)
+    print("🗄️ Opening SQLite storage...")
+    get_db()
+    # Render and most hosts stop the process with SIGTERM; exit normally so atexit flushes the cache
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    
     # Clean up the old shared device ID file
     cleanup_shared_device_id()
     
@@ -3369,25 +6448,32 @@ if __name__ == "__main__":
         print(f"❌ Error setting up device system: {e}")
     
     # Ensure data files exist
-    for file in [CONFIG["QUESTIONS_FILE"], CONFIG["PARTICIPANTS_FILE"], CONFIG["QUIZ_COMPLETION_FILE"], CONFIG["DEVICE_FINGERPRINT_FILE"]]:
+    for file in [CONFIG["QUESTIONS_FILE"]]:
         try:
             with open(file, 'a+', encoding='utf-8') as f:
                 pass
         except Exception as e:
             print(f"Error creating file {file}: {e}")
     
-    # Start periodic cleanup thread
-    def periodic_cleanup():
-        while True:
-            time.sleep(3600)  # Run every hour
-            cleanup_old_admin_states()
-            print("🕒 Periodic cleanup completed")
-    
-    cleanup_thread = threading.Thread(target=periodic_cleanup, daemon=True)
-    cleanup_thread.start()
-    
-    # Start bot in a background thread
-    threading.Thread(target=bot.infinity_polling, daemon=True).start()
+    if CONFIG["SHARD_WORKERS"] > 1:
+        # Worker processes own the chats; this process only fetches and routes updates
+        completion_registry.snapshot()  # Seed the completion log once, before the workers start
+        shard_router.start()
+    else:
+        start_runtime()
+    
+    if CONFIG["UPDATE_MODE"] == "webhook":
+        setup_webhook()
+    elif shard_router.running:
+        bot.remove_webhook()
+        threading.Thread(target=shard_router.poll, daemon=True).start()
+    elif async_engine.running:
+        bot.remove_webhook()
+        async_engine.start_polling()
+    else:
+        # Start bot in a background thread
+        bot.remove_webhook()
+        threading.Thread(target=bot.infinity_polling, daemon=True).start()
     
     # Run small web server so Render detects an open port
     port = int(os.environ.get("PORT", 10000))